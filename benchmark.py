@@ -1,99 +1,241 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+import json
 import time
 import random
-import itertools
-import threading
+import signal
+import multiprocessing
 
+import codes
 import utils
+import solver
 
-def generate_codes(code_length=4, color_count=6):
-    if code_length > 0:
-        for i in range(color_count):
-            for subcode in generate_codes(code_length=code_length - 1, color_count=color_count):
-                yield [i] + subcode
-    else:
-        yield []
+WORKER_COUNT = multiprocessing.cpu_count() # The number of processes playing games
+CHUNK_SIZE = 64 # The number of codes a process claims at once
 
-def input_guess(code_length, color_count, possibilities):
-    if len(possibilities) == color_count ** code_length:
-        guess = [0] * ((code_length + 1) // 2) + [1] * (code_length // 2)
-    else:
-        guess = random.choice(possibilities)
+CHUNKS, GAMES, TOTAL, MINI, MAXI = range(5) # The indices of the counters shared by the processes
+COUNTER_COUNT = 5
+
+# The (code_length, color_count, max_attempts, strategy) points played by the suite mode
+SUITE = [
+    (4, 6, 12, "random"),
+    (4, 6, 12, "minimax"),
+    (4, 6, 12, "expected_size"),
+    (4, 6, 12, "entropy"),
+    (3, 8, 12, "minimax"),
+    (5, 4, 12, "minimax")
+]
+SUITE_GAMES = 1296 # When there are more codes than that (the classic game has 1296), the suite only plays against that many random codes instead of every one of them
+SUITE_SEED = 1234 # The random codes and the random choices of the solver are the same every time, so that two runs can be compared
+
+RESULTS_PATH = "benchmark_results.json"
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+BUCKET_PASSES = 40 # The number of times the suite replays every game of the random strategy to check that the memory of the solver's buckets is given back
 
-    possibilities.remove(guess)
-    return guess
+MEAN_TOLERANCE = 0.01 # The increase of the average number of attempts which is reported as a regression
+SPEED_TOLERANCE = 0.4 # The relative decrease of games per second which is reported as a regression, timings being much noisier than attempts
 
-def benchmark(code, color_count=6, max_attempts=12):
-    possibilities = list(map(list, itertools.product(range(color_count), repeat=len(code))))
+def input_guess(matrix, possibilities, strategy, history):
+    # The guess isn't removed from the possibilities here, the feedback filter takes care of it unless it's the right code
+    return solver.choose_guess(matrix, possibilities, strategy, history)
+
+def benchmark(code, color_count=6, max_attempts=12, strategy=utils.DEFAULT_STRATEGY):
+    matrix = solver.get_feedback_matrix(len(code), color_count)
+    possibilities = solver.new_possibilities(matrix)
+    history = []
 
     for i in range(max_attempts):
-        attempt = input_guess(len(code), color_count, possibilities)
-        perfect, partial = utils.compare_codes(attempt, code)
+        attempt = input_guess(matrix, possibilities, strategy, history)
+        perfect, partial = solver.compare(matrix, attempt, code)
 
         if perfect == len(code):
             return i
         else:
-            possibilities = list(filter(lambda possibility: utils.compare_codes(attempt, possibility) == (perfect, partial), possibilities))
+            history.append((attempt, perfect, partial))
+            possibilities = solver.filter_possibilities(matrix, possibilities, attempt, perfect, partial)
 
     return max_attempts
 
-def main():
-    def worker(status):
-        while status["running"]:
-            for code in generate_codes():
-                score = benchmark(code) + 1
-
-                status["total"] += score
-                status["games"] += 1
-
-                if status["mini"] is None or score < status["mini"]:
-                    status["mini"] = score
-
-                if status["maxi"] is None or score > status["maxi"]:
-                    status["maxi"] = score
-
-                if not status["running"]:
-                    break
-            else:
-                status["iteration"] += 1
-
-    worker.running = True
-
-    status = {
-        "running": True,
-        "iteration": 0,
-        "games": 0,
-        "total": 0,
-        "mini": None,
-        "maxi": None
+def worker(strategy, code_length, color_count, running, next_chunk, counters):
+    # Runs in its own process: claims chunks of codes until the benchmark is stopped, and adds the results of each chunk to the shared counters once it's done
+    # so that the counters are only locked once per chunk, and always contain whole chunks
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is handled by the main process, which lets the current chunk finish
+    solver.PROCESS_COUNT = 1 # The benchmark already uses every core, the solver mustn't start processes of its own
+    chunk_count = -(-codes.code_count(code_length, color_count) // CHUNK_SIZE)
+
+    while running.value:
+        with next_chunk.get_lock(): # The chunks are handed out one at a time, so the processes which play faster games just take more of them
+            chunk = next_chunk.value
+            next_chunk.value += 1
+
+        scores = []
+        start = chunk % chunk_count * CHUNK_SIZE
+        for code in codes.iterate_codes(code_length, color_count, start, start + CHUNK_SIZE):
+            scores.append(benchmark(code, color_count, strategy=strategy) + 1)
+
+        with counters.get_lock():
+            counters[CHUNKS] += 1
+            counters[GAMES] += len(scores)
+            counters[TOTAL] += sum(scores)
+            counters[MINI] = min(scores) if counters[MINI] == 0 else min(counters[MINI], min(scores))
+            counters[MAXI] = max(counters[MAXI], max(scores))
+
+def run_point(code_length, color_count, max_attempts, strategy):
+    # Plays the games of one point of the suite from a clean state, and returns its results
+    solver.get_feedback_matrix.cache_clear() # Don't let a point use the rows and buckets computed by the previous ones
+    solver.representative_guesses.cache_clear()
+    random.seed(SUITE_SEED)
+
+    total = codes.code_count(code_length, color_count)
+    if total <= SUITE_GAMES:
+        secrets = list(codes.iterate_codes(code_length, color_count))
+    else:
+        secrets = [codes.unrank(random.randrange(total), code_length, color_count) for i in range(SUITE_GAMES)]
+
+    start = time.time()
+    scores = [benchmark(code, color_count, max_attempts, strategy) + 1 for code in secrets]
+    seconds = time.time() - start
+
+    return {
+        "code_length": code_length,
+        "color_count": color_count,
+        "max_attempts": max_attempts,
+        "strategy": strategy,
+        "games": len(scores),
+        "mean": sum(scores) / len(scores),
+        "maximum": max(scores),
+        "failures": sum(1 for score in scores if score > max_attempts), # benchmark returns max_attempts when the code wasn't found
+        "games_per_second": len(scores) / seconds,
+        "seconds": seconds
     }
 
-    threads = []
-    for i in range(1):
-        thread = threading.Thread(target=worker, args=[status])
-        thread.start()
-        threads.append(thread)
+def live_bucket_bytes(possibilities, seen):
+    # The size of the buckets which can still be reached from a set of possibilities, each set being counted once
+    if possibilities.buckets is None or id(possibilities) in seen:
+        return 0
+
+    seen.add(id(possibilities))
+    return sum(len(bucket.bits) + live_bucket_bytes(bucket, seen) for bucket in possibilities.buckets[1].values())
+
+def check_buckets(code_length=4, color_count=6):
+    # Replays every game of the random strategy, whose guesses keep changing the buckets, and returns the regressions if the solver counts more bucket bytes than the buckets still alive
+    solver.get_feedback_matrix.cache_clear()
+    random.seed(SUITE_SEED)
+    matrix = solver.get_feedback_matrix(code_length, color_count)
+
+    for i in range(BUCKET_PASSES):
+        for code in codes.iterate_codes(code_length, color_count):
+            benchmark(code, color_count, strategy="random")
+
+    seen = set()
+    live = live_bucket_bytes(matrix["possibilities"], seen) + sum(live_bucket_bytes(state["possibilities"], seen) for state in matrix["states"].values())
+    if matrix["bucket_bytes"] > live:
+        return ["{}x{} buckets: {} bytes counted after {} passes but {} bytes alive".format(code_length, color_count, matrix["bucket_bytes"], BUCKET_PASSES, live)]
+    return []
+
+def point_key(point):
+    return point["code_length"], point["color_count"], point["max_attempts"], point["strategy"]
+
+def compare_results(results, baseline):
+    # Returns the list of regressions of the results compared with the baseline, the points which aren't in both being ignored
+    previous = {point_key(point): point for point in baseline["points"]}
+    regressions = []
+
+    for point in results["points"]:
+        old = previous.get(point_key(point))
+        if old is None:
+            continue
+
+        name = "{}x{} {} ({} attempts)".format(point["code_length"], point["color_count"], point["strategy"], point["max_attempts"])
+        if point["mean"] > old["mean"] + MEAN_TOLERANCE:
+            regressions.append("{}: {:.4f} attempts on average instead of {:.4f}".format(name, point["mean"], old["mean"]))
+        if point["maximum"] > old["maximum"] or point["failures"] > old["failures"]:
+            regressions.append("{}: {} attempts at most and {} failures instead of {} and {}".format(name, point["maximum"], point["failures"], old["maximum"], old["failures"]))
+        if point["games_per_second"] < old["games_per_second"] * (1 - SPEED_TOLERANCE):
+            regressions.append("{}: {:.1f} games/second instead of {:.1f}".format(name, point["games_per_second"], old["games_per_second"]))
+
+    return regressions
+
+def suite(results_path, baseline_path):
+    # Plays every point of the suite, saves the results and compares them with the baseline if there is one; returns the exit code
+    results = {"seed": SUITE_SEED, "games": SUITE_GAMES, "points": []}
+
+    for point in SUITE:
+        result = run_point(*point)
+        results["points"].append(result)
+        print("{code_length}x{color_count} {strategy:<13} {games:>5} games  average {mean:.4f}  maximum {maximum:>2}  failures {failures}  {games_per_second:>9.1f} games/second  {seconds:.2f} seconds".format(**result))
+
+    with open(results_path, "w") as file:
+        json.dump(results, file, indent=4)
+    print("Saved to", results_path)
+
+    regressions = check_buckets()
+
+    if not os.path.isfile(baseline_path):
+        print("No baseline to compare with at", baseline_path)
+    else:
+        with open(baseline_path) as file:
+            regressions += compare_results(results, json.load(file))
+
+    for regression in regressions:
+        print("Regression:", regression)
+    print("{} regressions compared with {}".format(len(regressions), baseline_path))
+
+    return 1 if regressions else 0
+
+def main():
+    # Usage: python3 benchmark.py [STRATEGY] [CODE_LENGTH] [COLOR_COUNT]
+    #     or python3 benchmark.py suite [RESULTS_PATH] [BASELINE_PATH]
+    if len(sys.argv) > 1 and sys.argv[1] == "suite":
+        sys.exit(suite(sys.argv[2] if len(sys.argv) > 2 else RESULTS_PATH, sys.argv[3] if len(sys.argv) > 3 else BASELINE_PATH))
+
+    strategy = sys.argv[1] if len(sys.argv) > 1 else utils.DEFAULT_STRATEGY # The strategy to benchmark can be given on the command line, see solver.STRATEGIES
+    code_length = int(sys.argv[2]) if len(sys.argv) > 2 else utils.DEFAULT_CODE_LENGTH
+    color_count = int(sys.argv[3]) if len(sys.argv) > 3 else utils.DEFAULT_COLOR_COUNT
+
+    if strategy not in solver.STRATEGIES:
+        print("Unknown strategy: {} (available: {})".format(strategy, ", ".join(solver.STRATEGIES)))
+        return
+
+    running = multiprocessing.Value("b", True, lock=False)
+    next_chunk = multiprocessing.Value("q", 0) # The chunks of codes are numbered across iterations: chunk i is the chunk i % chunk_count of the code space
+    counters = multiprocessing.Array("q", COUNTER_COUNT) # See the counter indices in the constants, the minimum being 0 until there's a game
+
+    processes = []
+    for i in range(WORKER_COUNT):
+        process = multiprocessing.Process(target=worker, args=[strategy, code_length, color_count, running, next_chunk, counters])
+        process.start()
+        processes.append(process)
+
+    chunk_count = -(-codes.code_count(code_length, color_count) // CHUNK_SIZE)
+    print("Benchmarking the {} strategy with {} pins and {} colors on {} processes".format(strategy, code_length, color_count, WORKER_COUNT))
+    print()
 
     try:
         start = time.time()
-        previous = status["iteration"]
-        time.sleep(1)
+        previous = 0
         while True:
-            if status["iteration"] > previous:
-                print("*** Iteration %d" % status["iteration"])
-                print("Total: %d attempts on %d games" % (status["total"], status["games"]))
-                print("Average: %d / %d = %f" % (status["total"], status["games"], status["total"] / status["games"]))
-                print("Minimum: %d - Maximum: %d" % (status["mini"], status["maxi"]))
-                print("Speed: %f games/second" % (status["games"] / (time.time() - start)))
+            time.sleep(0.1)
+
+            with counters.get_lock():
+                chunks, games, total, mini, maxi = counters[:]
+
+            iteration = chunks // chunk_count # An iteration is over once as many chunks as there are in the code space have been played
+            if iteration > previous:
+                print("*** Iteration %d" % iteration)
+                print("Total: %d attempts on %d games" % (total, games))
+                print("Average: %d / %d = %f" % (total, games, total / games))
+                print("Minimum: %d - Maximum: %d" % (mini, maxi))
+                print("Speed: %f games/second" % (games / (time.time() - start)))
                 print()
-                previous = status["iteration"]
-            else:
-                time.sleep(5)
+                previous = iteration
     except KeyboardInterrupt:
-        status["running"] = False
-        for thread in threads:
-            thread.join()
+        running.value = False
+        for process in processes:
+            process.join()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+### BEGIN IMPORTS ###
+
+import random
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, without it the sets are walked byte by byte
+    numpy = None
+
+### END IMPORTS ###
+
+### BEGIN CONSTANTS ###
+
+POPCOUNTS = bytes(bin(byte).count("1") for byte in range(0x100)) # POPCOUNTS[byte] is the number of bits set in that byte
+BIT_VALUES = [bytes(int(byte != 0) << bit for byte in range(0x100)) for bit in range(8)] # BIT_VALUES[bit] maps every non-zero byte to 1 << bit, to be used with bytes.translate
+BIT_POSITIONS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(0x100)] # BIT_POSITIONS[byte] lists the bits set in that byte, from the lowest one
+
+### END CONSTANTS ###
+
+### BEGIN CANDIDATE SET ###
+
+class CandidateSet:
+    # A set of code ranks (see codes.py) stored as a bitset, the rank r being bit r % 8 of byte r // 8, which only takes one bit per possible code
+    # Sets are never changed once they are filled (filtering returns a new set), so the same set can be shared by several games
+
+    def __init__(self, size, full=False):
+        self.size = size # The number of codes which could be in the set, i.e. color_count ** code_length
+
+        if full:
+            self.bits = bytearray(b"\xff" * (size // 8))
+            if size % 8:
+                self.bits.append((1 << size % 8) - 1) # The bits after the last code must stay unset
+            self.count = size
+        else:
+            self.bits = bytearray(-(-size // 8))
+            self.count = 0
+
+        self.buckets = None # The (guess, {feedback id: set}) of the last guess this set was filtered by, so that filtering it the same way again is a lookup
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, rank):
+        return 0 <= rank < self.size and bool(self.bits[rank >> 3] >> (rank & 7) & 1)
+
+    def __iter__(self):
+        # Yields the ranks in increasing order, skipping the empty bytes
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                for bit in BIT_POSITIONS[byte]:
+                    yield (byte_index << 3) + bit
+
+    def add(self, rank):
+        if rank not in self:
+            self.bits[rank >> 3] |= 1 << (rank & 7)
+            self.count += 1
+
+    def add_ranks(self, ranks):
+        # Adds a NumPy array of ranks which aren't in the set yet
+        numpy.bitwise_or.at(numpy.frombuffer(self.bits, dtype=numpy.uint8), ranks >> 3, (1 << (ranks & 7)).astype(numpy.uint8))
+        self.count += len(ranks)
+
+    def batches(self, batch_size):
+        # Yields the ranks as NumPy arrays of at most batch_size ranks, in increasing order
+        source = numpy.frombuffer(self.bits, dtype=numpy.uint8)
+        step = max(1, batch_size // 8)
+
+        for start in range(0, len(source), step):
+            ranks = numpy.flatnonzero(numpy.unpackbits(source[start:start + step], bitorder="little"))
+            if len(ranks):
+                yield ranks + start * 8
+
+    def filter(self, keep):
+        # Returns a new set with the ranks for which keep(rank) is true
+        result = CandidateSet(self.size)
+        for rank in self:
+            if keep(rank):
+                result.bits[rank >> 3] |= 1 << (rank & 7)
+                result.count += 1
+        return result
+
+    def filter_mask(self, mask):
+        # Same as filter, but keep is given as a mask with one byte per rank, the ranks whose byte is zero being removed
+        mask = bytes(mask) + bytes(len(self.bits) * 8 - len(mask))
+
+        # Pack the mask to one bit per rank: the bytes i, i + 8, i + 16... of the mask become the bits i of each byte, and all of it runs in C
+        packed = 0
+        for bit in range(8):
+            packed |= int.from_bytes(mask[bit::8].translate(BIT_VALUES[bit]), "little")
+
+        result = CandidateSet(self.size)
+        result.bits = bytearray((packed & int.from_bytes(self.bits, "little")).to_bytes(len(self.bits), "little"))
+        result.count = sum(result.bits.translate(POPCOUNTS))
+        return result
+
+    def filter_batches(self, keep, batch_size):
+        # Same as filter, but keep takes a NumPy array of ranks and returns an array of booleans, and whole blocks of bits are written at once
+        result = CandidateSet(self.size)
+        source = numpy.frombuffer(self.bits, dtype=numpy.uint8)
+        target = numpy.frombuffer(result.bits, dtype=numpy.uint8)
+        step = max(1, batch_size // 8)
+
+        for start in range(0, len(source), step):
+            alive = numpy.unpackbits(source[start:start + step], bitorder="little").astype(bool)
+            ranks = numpy.flatnonzero(alive)
+            if len(ranks):
+                alive[ranks] = kept = keep(ranks + start * 8)
+                target[start:start + step] = numpy.packbits(alive, bitorder="little")
+                result.count += int(numpy.count_nonzero(kept))
+
+        return result
+
+    def select(self, indices):
+        # Returns the ranks at the given (sorted) positions in the set, e.g. select([0]) is the lowest rank in the set
+        if numpy is not None:
+            counts = numpy.cumsum(numpy.frombuffer(POPCOUNTS, dtype=numpy.uint8)[numpy.frombuffer(self.bits, dtype=numpy.uint8)], dtype=numpy.int64)
+            byte_indices = numpy.searchsorted(counts, numpy.asarray(indices, dtype=numpy.int64), side="right") # The byte which contains each requested position
+            previous = numpy.concatenate(([0], counts))[byte_indices] # The number of ranks before that byte
+            return numpy.array([(int(byte_index) << 3) + BIT_POSITIONS[self.bits[byte_index]][index - int(before)] for byte_index, index, before in zip(byte_indices, indices, previous)], dtype=numpy.int64)
+
+        ranks, position = [], 0
+        indices = iter(indices)
+        index = next(indices, None)
+        for byte_index, byte in enumerate(self.bits):
+            while index is not None and index < position + POPCOUNTS[byte]:
+                ranks.append((byte_index << 3) + BIT_POSITIONS[byte][index - position])
+                index = next(indices, None)
+
+            if index is None:
+                break
+            position += POPCOUNTS[byte]
+        return ranks
+
+    def choice(self):
+        # Returns a random rank of the set
+        return int(self.select([random.randrange(self.count)])[0])
+
+    def sample(self, count):
+        # Returns count random ranks of the set (or all of them if there aren't enough), as a NumPy array if NumPy is available, or a list
+        if count >= self.count:
+            indices = range(self.count)
+        else:
+            indices = sorted(random.sample(range(self.count), count))
+
+        return self.select(indices)
+
+### END CANDIDATE SET ###
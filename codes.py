@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+### BEGIN CODE INDEXING ###
+
+# Every code of a given length and number of colors is identified by its rank: its colors read as the digits of a number in base color_count,
+# the first pin being the most significant digit. Ranks follow the same order as itertools.product(range(color_count), repeat=code_length).
+
+def code_count(code_length, color_count):
+    return color_count ** code_length
+
+def is_valid_code(code, code_length, color_count):
+    # Codes coming from tokens or from the network may have the wrong length or colors out of range, and those can't be ranked
+    return len(code) == code_length and all(0 <= color < color_count for color in code)
+
+def rank(code, color_count):
+    index = 0
+    for color in code:
+        index = index * color_count + color
+    return index
+
+def unrank(index, code_length, color_count):
+    code = [0] * code_length
+    for i in range(code_length - 1, -1, -1): # Fill the code from the least significant pin (the last one) to the most significant one
+        index, code[i] = divmod(index, color_count)
+    return code
+
+def iterate_codes(code_length, color_count, start=0, stop=None):
+    # Lazily yields the codes ranked from start (included) to stop (excluded), without ever building the full list
+    if stop is None or stop > code_count(code_length, color_count):
+        stop = code_count(code_length, color_count)
+
+    if start >= stop:
+        return
+
+    code = unrank(start, code_length, color_count)
+    for index in range(start, stop):
+        yield code.copy() # Yield a copy so that the caller can keep or edit the code without breaking the iteration
+
+        for i in range(code_length - 1, -1, -1): # Increment the code like an odometer, carrying over to the pin on the left when a pin goes past the last color
+            code[i] += 1
+            if code[i] < color_count:
+                break
+            code[i] = 0
+
+### END CODE INDEXING ###
@@ -7,13 +7,12 @@ import sys
 import zlib
 import base64
 import curses
-import random
 import socket
 import colorsys
 import traceback
-import itertools
 
 import utils
+import solver
 
 ### END IMPORTS ###
 
@@ -25,7 +24,7 @@ line = 0 # The number of lines since the beginning of the screen
 
 ### BEGIN GAME STEPS ###
 
-def input_guess(screen, code_length, color_count, possibilities):
+def input_guess(screen, matrix, strategy, history):
     global line
 
     screen.refresh()
@@ -34,12 +33,7 @@ def input_guess(screen, code_length, color_count, possibilities):
 
     # TODO: Animation?
 
-    if len(possibilities) == color_count ** code_length:
-        guess = [0] * ((code_length + 1) // 2) + [1] * (code_length // 2)
-    else:
-        guess = random.choice(possibilities)
-
-    possibilities.remove(guess)
+    guess = solver.state_guess(matrix, strategy, history) # The guess isn't removed from the possibilities here, the feedback filter takes care of it unless it's the right code
 
     utils.print_code(screen, utils.PREFIX, guess, -1)
     line += 1
@@ -47,7 +41,7 @@ def input_guess(screen, code_length, color_count, possibilities):
 
     return guess
 
-def play_game(screen, color_count, max_attempts, code, attempts):
+def play_game(screen, color_count, max_attempts, code, attempts, strategy=utils.DEFAULT_STRATEGY):
     global line
 
     utils.print_code(screen, "The computer will try to guess the following code:", code, -1)
@@ -60,8 +54,10 @@ def play_game(screen, color_count, max_attempts, code, attempts):
         attempts = attempts[:max_attempts]
 
     screen.refresh()
-    possibilities = list(map(list, itertools.product(range(color_count), repeat=len(code))))
-    total_possibilities = len(possibilities)
+    matrix = solver.get_feedback_matrix(len(code), color_count)
+    history = [] # The (guess, perfect, partial) of every attempt so far, which is also the key of the solver's cache (the games follow the same first guesses, which are only computed by the first game)
+    possibilities = solver.state_possibilities(matrix, history, solver.deterministic(strategy)) # The possible codes, see solver.new_possibilities
+    total_possibilities = possibilities.count
 
     for i, attempt in enumerate(attempts):
         utils.print_code(screen, utils.PREFIX, attempt, -1)
@@ -91,10 +87,11 @@ def play_game(screen, color_count, max_attempts, code, attempts):
 
             screen.refresh()
             # Remove all the remaining possibilities that don't match the new conditions
-            possibilities = list(filter(lambda possibility: utils.compare_codes(attempt, possibility) == (perfect, partial), possibilities))
+            history.append((attempt, perfect, partial))
+            possibilities = solver.state_possibilities(matrix, history, solver.deterministic(strategy))
     else:
         for attempt in range(len(attempts), max_attempts): # Limits the number of attempts to the chosen amount
-            guess = input_guess(screen, len(code), color_count, possibilities)
+            guess = input_guess(screen, matrix, strategy, history)
             attempts.append(guess.copy())
 
             perfect, partial = utils.compare_codes(guess, code) # Compare the current attempt with the real code
@@ -119,13 +116,18 @@ def play_game(screen, color_count, max_attempts, code, attempts):
                 screen.move(line, 0)
                 screen.refresh()
                 # Remove all the remaining possibilities that don't match the new conditions
-                possibilities = list(filter(lambda possibility: utils.compare_codes(guess, possibility) == (perfect, partial), possibilities))
+                history.append((guess, perfect, partial))
+                possibilities = solver.state_possibilities(matrix, history, solver.deterministic(strategy))
 
         else: # If we reached the maximum number of attempts without quitting the loop, it means the user failed to guess the code and he lost
-            screen.addstr("The computer failed! Progress: {}%".format(100 - int(len(possibilities) / total_possibilities * 100)))
+            screen.addstr("The computer failed! Progress: {}%".format(100 - int(possibilities.count / total_possibilities * 100)))
             line += 1
             screen.move(line, 0)
 
+    if utils.DEBUG:
+        screen.addstr("Solver cache: {} hits, {} misses\n\r".format(matrix["state_hits"], matrix["state_misses"]))
+        line += 1
+
     screen.refresh() # Update the screen before going to sleep, or it would "freeze" before updating, not showing the final text before resetting
     if not utils.DEBUG:
         curses.napms(3000)
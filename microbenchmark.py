@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import curses
+import random
+import socket
+import tracemalloc
+
+import utils
+
+MIN_TIME = 0.2 # The minimum number of seconds each measure runs for, the number of calls being doubled until it's reached
+
+CODE_LENGTHS = [4, 16, 256, 4096] # From the default game to codes in the thousands
+COLOR_COUNT = 8
+TOKEN_ATTEMPTS = 10 # The number of attempts stored in the benchmarked tokens
+PACKET_SIZES = [16, 1024, 60000] # The size of the data sent in the benchmarked packets, the maximum being 65536 with the framing
+
+def xterm_color(number):
+    # The RGB values (from 0 to 1000 like curses.color_content) of the 256 colors of xterm, used instead of the terminal's colors since there's no terminal here
+    if number < 16: # The basic colors, the bits being red, green and blue, and the bright colors following the dim ones
+        if number == 8:
+            return 500, 500, 500
+        level = 1000 if number > 8 else 750 if number == 7 else 500
+        return tuple(level * (number >> bit & 1) for bit in range(3))
+    elif number < 232: # A 6x6x6 color cube
+        levels = (0, 373, 529, 686, 843, 1000)
+        number -= 16
+        return levels[number // 36], levels[number // 6 % 6], levels[number % 6]
+    else: # A gray ramp
+        level = (number - 232) * 39 + 31
+        return level, level, level
+
+def measure(function):
+    # Returns the time taken by one call in nanoseconds, and the memory allocated by one call in bytes (the peak of what it allocated, including what it freed before returning)
+    count = 1
+    while True:
+        start = time.perf_counter_ns()
+        for i in range(count):
+            function()
+        elapsed = time.perf_counter_ns() - start
+
+        if elapsed >= MIN_TIME * 1e9:
+            break
+        count *= 2
+
+    tracemalloc.start() # Starting again after stop clears the traces and the peak, which reset_peak would only do from Python 3.9
+    before = tracemalloc.get_traced_memory()[0]
+    function()
+    allocated = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return elapsed / count, allocated
+
+def benchmarks():
+    # Yields the (name, size, function) of every measure, the size being the code length or the packet length
+    for code_length in CODE_LENGTHS:
+        guess = utils.generate_code(code_length, COLOR_COUNT)
+        correct = utils.generate_code(code_length, COLOR_COUNT)
+        attempts = [utils.generate_code(code_length, COLOR_COUNT) for i in range(TOKEN_ATTEMPTS)]
+        token = utils.encode_token(0, 0, 0, COLOR_COUNT, utils.DEFAULT_MAX_ATTEMPTS, correct, attempts)
+
+        yield "compare_codes", code_length, lambda: utils.compare_codes(guess, correct)
+        yield "generate_code", code_length, lambda: utils.generate_code(code_length, COLOR_COUNT)
+        yield "encode_token", code_length, lambda: utils.encode_token(0, 0, 0, COLOR_COUNT, utils.DEFAULT_MAX_ATTEMPTS, correct, attempts)
+        yield "decode_token", code_length, lambda: utils.decode_token(token)
+
+    sender, receiver = socket.socketpair() # Stands for a client and the server, without going through the network
+    for packet_size in PACKET_SIZES:
+        data = bytes(random.getrandbits(8) for i in range(packet_size))
+
+        def round_trip():
+            utils.send_packet(sender, data)
+            utils.receive_packet(receiver)
+
+        yield "packet_round_trip", packet_size, round_trip # send_packet and receive_packet, one after the other
+
+    curses.COLORS = 256 # find_nearest_color needs the colors of the terminal, use the ones of xterm instead
+    curses.color_content = xterm_color
+    yield "find_nearest_color", curses.COLORS, lambda: utils.find_nearest_color(0.3, 0.6, 0.9)
+
+def main():
+    # Usage: python3 microbenchmark.py [NAME...] to only run the measures of the given functions
+    names = sys.argv[1:]
+
+    print("{:<20} {:>6} {:>14} {:>14}".format("Function", "Size", "ns/op", "Bytes/op"))
+    for name, size, function in benchmarks():
+        if names and name not in names:
+            continue
+
+        nanoseconds, allocated = measure(function)
+        print("{:<20} {:>6} {:>14.0f} {:>14}".format(name, size, nanoseconds, allocated))
+
+if __name__ == "__main__":
+    main()
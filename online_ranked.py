@@ -156,8 +156,23 @@ def get_scoreboard(page_size, offset):
     global client_socket
 
     utils.send_packet(client_socket, "SB:{} {}".format(page_size, offset).encode("utf8"))
+    return decode_scoreboard(utils.receive_packet(client_socket), page_size)
+
+def get_rank(around):
+    # Returns the rank of the player (None if they never finished a game), and the entries from the rank - around to the rank + around with the rank of the first one
+    global client_socket
+
+    utils.send_packet(client_socket, "SB:ME {}".format(around).encode("utf8"))
     answer_bytes = utils.receive_packet(client_socket)
 
+    rank = int.from_bytes(answer_bytes[0:8], "big")
+    offset = int.from_bytes(answer_bytes[8:16], "big")
+    if rank == 2**64-1:
+        return None, offset, []
+
+    return rank, offset, decode_scoreboard(answer_bytes[16:], 2 * around + 1)
+
+def decode_scoreboard(answer_bytes, page_size):
     scoreboard = []
 
     j = 0
@@ -204,6 +219,8 @@ def display_scoreboard(screen):
     if not scoreboard:
         return
 
+    rank, rank_offset, around = get_rank(2)
+
     key = None
     screen.keypad(False)
     while key is None or (key != "\n" and ord(key) != 27):
@@ -211,6 +228,10 @@ def display_scoreboard(screen):
         screen.addstr("Current scoreboard:\n\r")
         for entry in scoreboard:
             screen.addstr("{}: {}\n\r".format(entry[0], entry[1]))
+        if rank is not None and rank >= len(scoreboard): # Show where the player stands when they aren't on the first page
+            screen.addstr("\n\rYour rank: #{}\n\r".format(rank + 1))
+            for i, entry in enumerate(around):
+                screen.addstr("#{} {}: {}\n\r".format(rank_offset + i + 1, entry[0], entry[1]))
         screen.addstr("Press enter or escape to start a new game.\n\r")
 
         screen.refresh()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+
+import utils
+import solver
+
+DEFAULT_DEPTH = 3
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node.get("next", {}).values())
+
+def main():
+    # Usage: python3 opening_book.py [STRATEGY] [CODE_LENGTH] [COLOR_COUNT] [DEPTH]
+    strategy = sys.argv[1] if len(sys.argv) > 1 else utils.DEFAULT_STRATEGY
+    code_length = int(sys.argv[2]) if len(sys.argv) > 2 else utils.DEFAULT_CODE_LENGTH
+    color_count = int(sys.argv[3]) if len(sys.argv) > 3 else utils.DEFAULT_COLOR_COUNT
+    depth = int(sys.argv[4]) if len(sys.argv) > 4 else DEFAULT_DEPTH
+
+    if strategy not in solver.SCORES: # The random strategy doesn't play the same guesses every game, so there is nothing to precompute
+        print("Unknown strategy: {} (available: {})".format(strategy, ", ".join(solver.SCORES)))
+        return
+
+    start = time.time()
+    matrix = solver.get_feedback_matrix(code_length, color_count)
+    if matrix["sampled"]: # The codes which are too many to be listed can't be split by feedback either
+        print("Too many codes to build an opening book: {} ** {}".format(color_count, code_length))
+        return
+
+    book = solver.build_opening_book(matrix, solver.new_possibilities(matrix), strategy, depth)
+    solver.save_opening_book(book, code_length, color_count, strategy)
+
+    print("Built the {} opening book for {} pins and {} colors: {} guesses over {} moves in {:.1f} seconds".format(strategy, code_length, color_count, count_nodes(book), depth, time.time() - start))
+    print("Saved to", solver.opening_book_path(code_length, color_count, strategy))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import sys
+import math
+import time
+import operator
+import itertools
+import functools
+import collections
+
+import codes
+import utils
+import solver
+
+# The optimal strategy is the one which finds every code in the fewest guesses in the worst case, and then in the fewest guesses on average.
+# It is found by a depth-first search over every guess and every feedback (iterative deepening on the worst case, then branch and bound on the total number of guesses),
+# which is only tractable thanks to lower bounds which cut the guesses which can't beat the best one found so far, and to a transposition table of the sets already solved.
+# The result is saved as the opening book of the "optimal" strategy, covering every game, so that the solver plays it like any other book.
+
+MAX_CODES = 4096 # Only the games with a feedback matrix can be searched, and even those can take hours above a few hundred codes
+
+@functools.lru_cache(maxsize=None)
+def lower_bound(size, limit, branching):
+    # The fewest guesses size secrets can take in total if they must all be found within limit guesses, or infinity if they can't all be:
+    # at most one secret is found with the first guess, at most branching (the number of feedbacks other than the right code) with the second one, then branching ** 2...
+    total, found, level, width = 0, 0, 1, 1
+    while found < size:
+        if level > limit:
+            return math.inf
+        count = min(width, size - found)
+        total += count * level
+        found += count
+        level += 1
+        width *= branching
+    return total
+
+def new_search(code_length, color_count):
+    matrix = solver.get_feedback_matrix(code_length, color_count)
+    return {
+        "matrix": matrix,
+        "perfect": solver.feedback_id(code_length, 0, code_length),
+        "branching": (code_length + 1) * (code_length + 2) // 2 - 2, # Every (perfect, partial) with perfect + partial <= code_length, except the right code and (code_length - 1, 1) which can't happen
+        "table": {}, # (secrets, limit) -> (total, exact, guess): the fewest guesses to find the secrets within limit guesses if exact, otherwise a lower bound of it
+        "nodes": 0 # The number of sets of secrets searched (not found in the table)
+    }
+
+def solve(search, secrets, limit, budget, history=()):
+    # Returns the (total, guess) of the strategy which finds every secret (a tuple of ranks) within limit guesses with the fewest guesses in total,
+    # or None if it takes more than budget guesses or if it can't be done within the limit; the history is the tuple of guesses which led to the secrets
+    size = len(secrets)
+    if limit < 1 or lower_bound(size, limit, search["branching"]) > budget:
+        return None
+    elif size == 1:
+        return 1, secrets[0]
+    elif size == 2: # Playing one of them finds it with the first guess and the other one with the second guess, which can't be beaten
+        return 3, secrets[0]
+
+    table = search["table"]
+    entry = table.get((secrets, limit))
+    if entry is not None:
+        total, exact, guess = entry
+        if exact:
+            return (total, guess) if total <= budget else None
+        elif total > budget:
+            return None
+
+    search["nodes"] += 1
+    matrix, perfect, branching = search["matrix"], search["perfect"], search["branching"]
+    select = operator.itemgetter(*secrets)
+
+    guesses = solver.representative_guesses(matrix["code_length"], matrix["color_count"], tuple(sorted(history))) # The guesses which split the secrets like another one are skipped
+    guesses = itertools.chain(secrets, range(matrix["size"])) if guesses is None else guesses # The secrets first, since only them can be found with this guess and reach the floor
+
+    # Each guess costs one guess per secret, plus what the secrets of each feedback take afterwards, so the lower bounds of the feedbacks give one of the guess,
+    # and the guesses are tried from the lowest bound so that a good strategy is found early and cuts the others
+    floor = lower_bound(size, limit, branching)
+    options = []
+    seen = set() # The feedbacks of every secret for the guesses already seen, the guesses which give the same ones splitting the secrets the same way
+    for guess in guesses:
+        feedbacks = select(solver.feedback_row(matrix, guess))
+        if feedbacks in seen:
+            continue
+        seen.add(feedbacks)
+
+        sizes = collections.Counter(feedbacks)
+        if len(sizes) == 1 and perfect not in sizes: # Every secret gives the same feedback, nothing would be learnt
+            continue
+
+        bound = size + sum(lower_bound(count, limit - 1, branching) for feedback, count in sizes.items() if feedback != perfect)
+        if bound == floor and max(count for feedback, count in sizes.items() if feedback != perfect) <= 2: # One or two secrets always take their lower bound, so no guess can beat this one
+            options = [(bound, False, guess)]
+            break
+        elif bound <= budget:
+            options.append((bound, perfect not in sizes, guess))
+    options.sort()
+
+    best = None
+    for bound, inconsistent, guess in options:
+        if bound > budget: # The budget shrinks every time a better strategy is found, and the next guesses can only be worse
+            break
+
+        row = solver.feedback_row(matrix, guess)
+        partitions = {}
+        for secret in secrets:
+            partitions.setdefault(row[secret], []).append(secret)
+        partitions.pop(perfect, None)
+
+        total, remaining = size, bound - size # The guesses taken so far, and the lower bound of the feedbacks not searched yet
+        for feedback, partition in sorted(partitions.items(), key=lambda item: -len(item[1])): # The biggest feedbacks are the most likely to exceed the budget
+            remaining -= lower_bound(len(partition), limit - 1, branching)
+            result = solve(search, tuple(partition), limit - 1, budget - total - remaining, history + (tuple(codes.unrank(guess, matrix["code_length"], matrix["color_count"])),))
+            if result is None:
+                break
+            total += result[0]
+        else:
+            best = total, guess
+            budget = total - 1 # Only look for strictly better strategies from now on
+
+    if best is not None: # Every other guess was searched with a budget lower than the best one, so it is optimal
+        table[(secrets, limit)] = best[0], True, best[1]
+    else: # Nothing fits in the budget, so the optimal strategy takes more
+        table[(secrets, limit)] = max(budget + 1, entry[0] if entry is not None else 0), False, None
+
+    return best
+
+def build_tree(search, secrets, limit, history=()):
+    # Returns the strategy found for the secrets as an opening book node (see solver.build_opening_book), the secrets having been solved within that limit
+    matrix = search["matrix"]
+    total, guess = solve(search, secrets, limit, len(secrets) * limit, history) # Always in the table (or trivial) once the whole game is solved
+    node = {"guess": guess}
+
+    row = solver.feedback_row(matrix, guess)
+    partitions = {}
+    for secret in secrets:
+        if row[secret] != search["perfect"]:
+            partitions.setdefault(row[secret], []).append(secret)
+
+    if partitions:
+        history += (tuple(codes.unrank(guess, matrix["code_length"], matrix["color_count"])),)
+        node["next"] = {str(feedback): build_tree(search, tuple(partition), limit - 1, history) for feedback, partition in sorted(partitions.items())}
+
+    return node
+
+def main():
+    # Usage: python3 optimal.py [CODE_LENGTH] [COLOR_COUNT]
+    code_length = int(sys.argv[1]) if len(sys.argv) > 1 else utils.DEFAULT_CODE_LENGTH
+    color_count = int(sys.argv[2]) if len(sys.argv) > 2 else utils.DEFAULT_COLOR_COUNT
+
+    search = new_search(code_length, color_count)
+    matrix = search["matrix"]
+    if matrix["rows"] is None or matrix["size"] > MAX_CODES:
+        print("Too many codes to search for the optimal strategy: {} ** {}".format(color_count, code_length))
+        return
+
+    start = time.time()
+    secrets = tuple(range(matrix["size"]))
+    limit = 1
+    while lower_bound(len(secrets), limit, search["branching"]) == math.inf:
+        limit += 1
+
+    try:
+        while True: # Iterative deepening: the first limit which can be reached is the optimal worst case, and the total found with it is the optimal one for that worst case
+            print("Searching for a strategy within {} guesses... ({} sets searched so far, {:.1f} seconds)".format(limit, search["nodes"], time.time() - start))
+            result = solve(search, secrets, limit, len(secrets) * limit) # No strategy can take more than limit guesses for every secret
+            if result is not None:
+                break
+            limit += 1
+    except KeyboardInterrupt:
+        print("Interrupted, nothing was saved")
+        return
+
+    book = build_tree(search, secrets, limit)
+    solver.save_opening_book(book, code_length, color_count, "optimal")
+
+    print("Optimal strategy for {} pins and {} colors: {} guesses at most, {} on average ({} in total), found in {:.1f} seconds ({} sets searched)".format(code_length, color_count, limit, result[0] / len(secrets), result[0], time.time() - start, search["nodes"]))
+    print("Saved to", solver.opening_book_path(code_length, color_count, "optimal"))
+
+if __name__ == "__main__":
+    main()
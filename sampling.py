@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+### BEGIN IMPORTS ###
+
+import random
+import collections
+
+### END IMPORTS ###
+
+### BEGIN CONSTANTS ###
+
+SEARCH_RESTARTS = 4 # The number of times the search starts over from scratch before giving up
+SEARCH_NODES = 20000 # The number of pins the exact search may place before restarting with other colors
+SEARCH_STEPS = 2000 # The number of pins the approximate search may change before giving up
+RANDOM_COLORS = 2 # The number of random colors tried for a pin on top of the ones guessed at that position
+ESTIMATE_SAMPLES = 20 # The number of random codes checked to estimate how many codes are still possible
+
+### END CONSTANTS ###
+
+### BEGIN CONSISTENT CODES ###
+
+class Constraints:
+    # The state of a code against every guess of the history, updated pin by pin so that changing a pin costs O(len(history)) rather than O(len(history) * code_length)
+
+    def __init__(self, history, code):
+        self.history = history
+        self.code = code
+        self.counts = collections.Counter(code)
+        self.guess_counts = [collections.Counter(guess) for guess, perfect, partial in history]
+
+        self.perfect = [sum(1 for a, b in zip(code, guess) if a == b) for guess, perfect, partial in history]
+        self.common = [sum(min(self.counts[color], count) for color, count in guess_counts.items()) for guess_counts in self.guess_counts]
+
+        self.errors = [self.error(i, self.perfect[i], self.common[i]) for i in range(len(history))]
+        self.weights = [1] * len(history) # How much the error of each guess counts in the total, raised by the search for the guesses it can't satisfy
+        self.total = sum(self.errors)
+
+    def error(self, i, perfect, common):
+        # How far the code is from giving the same feedback as the secret code for the i-th guess, 0 meaning it gives exactly the same one
+        guess, expected_perfect, expected_partial = self.history[i]
+        return abs(perfect - expected_perfect) + abs(common - expected_perfect - expected_partial)
+
+    def reweight(self):
+        # Makes the guesses which still have an error count more, so that the search gets out of the local minimum it is stuck in
+        for i, error in enumerate(self.errors):
+            if error:
+                self.weights[i] += 1
+        self.total = sum(weight * error for weight, error in zip(self.weights, self.errors))
+
+    def change(self, position, color, apply):
+        # Returns the total (weighted) error if the pin at the given position took the given color, and changes it if apply is set
+        previous = self.code[position]
+        if color == previous:
+            return self.total
+
+        changes = []
+        total = 0
+
+        for i, (guess, expected_perfect, expected_partial) in enumerate(self.history):
+            perfect, common = self.perfect[i], self.common[i]
+            guessed = guess[position] if position < len(guess) else None
+
+            perfect += (color == guessed) - (previous == guessed)
+            common -= self.counts[previous] <= self.guess_counts[i][previous] # Removing a pin of a color only matters if the guess has at least as many of them
+            common += self.counts[color] < self.guess_counts[i][color] # Adding one only matters if the guess had more of them
+
+            error = self.error(i, perfect, common)
+            changes.append((perfect, common, error))
+            total += self.weights[i] * error
+
+        if apply:
+            self.code[position] = color
+            self.counts[previous] -= 1
+            self.counts[color] += 1
+            for i, (perfect, common, error) in enumerate(changes):
+                self.perfect[i], self.common[i], self.errors[i] = perfect, common, error
+            self.total = total
+
+        return total
+
+class ConsistentCodes:
+    # The possibilities of a game which has too many codes to list them: only the history is kept, and codes consistent with it are searched on demand, so the memory never depends on the number of codes
+
+    def __init__(self, code_length, color_count, history=()):
+        self.code_length = code_length
+        self.color_count = color_count
+        self.history = list(history)
+        self.size = color_count ** code_length
+        self.estimate = None
+
+    @property
+    def count(self):
+        # Same as CandidateSet.count, but only an estimate once there's a history, from the proportion of random codes which are consistent with it (len() can't be used as the count may not fit in an index)
+        if not self.history:
+            return self.size
+
+        if self.estimate is None:
+            consistent = sum(1 for i in range(ESTIMATE_SAMPLES) if Constraints(self.history, self.random_code()).total == 0)
+            self.estimate = self.size * consistent // ESTIMATE_SAMPLES
+
+        return self.estimate
+
+    def filter(self, guess, perfect, partial):
+        return ConsistentCodes(self.code_length, self.color_count, self.history + [(list(guess), perfect, partial)])
+
+    def random_code(self):
+        return [random.randrange(self.color_count) for i in range(self.code_length)]
+
+    def backtrack(self, budget):
+        # Exact search: the pins are colored from the first to the last, trying the colors in a random order, and a color is only kept if every guess of the history can still get its feedback
+        # Returns a consistent code, or None if none was found before budget pins were placed
+        history = self.history
+        targets = [(perfect, perfect + partial) for guess, perfect, partial in history] # The expected number of pins at the right place, and of pins in common
+        guess_counts = [collections.Counter(guess) for guess, perfect, partial in history]
+        guessed = [[guess[position] if position < len(guess) else None for guess, perfect, partial in history] for position in range(self.code_length)]
+
+        perfect, common = [0] * len(history), [0] * len(history)
+        counts = collections.Counter()
+        code = []
+        options = [iter(random.sample(range(self.color_count), self.color_count))] # The colors left to try for each pin placed so far, and for the next one
+
+        def shift(position, color, step):
+            # Counts the pin in (step = 1) or out of (step = -1) the results of every guess
+            counted = counts[color] if step > 0 else counts[color] - 1
+            for i, guess_count in enumerate(guess_counts):
+                perfect[i] += step * (guessed[position][i] == color)
+                common[i] += step * (counted < guess_count[color])
+            counts[color] += step
+
+        def fits(position, color):
+            remaining = self.code_length - position - 1
+            for i, (expected_perfect, expected_common) in enumerate(targets):
+                new_perfect = perfect[i] + (guessed[position][i] == color)
+                new_common = common[i] + (counts[color] < guess_counts[i][color])
+                if not (new_perfect <= expected_perfect <= new_perfect + remaining and new_common <= expected_common <= new_common + remaining):
+                    return False
+            return True
+
+        for node in range(budget):
+            position = len(code)
+            if position == self.code_length:
+                return code
+
+            for color in options[-1]:
+                if fits(position, color):
+                    shift(position, color, 1)
+                    code.append(color)
+                    options.append(iter(random.sample(range(self.color_count), self.color_count)))
+                    break
+            else: # No color fits this pin, go back to the previous one
+                options.pop()
+                if not code:
+                    return None # Every code was tried, nothing is consistent with the history
+                shift(position - 1, code.pop(), -1)
+
+        return code if len(code) == self.code_length else None
+
+    def closest(self):
+        # Approximate search: starting from a random code, repeatedly pick a random pin and give it the color which makes the code closest to the history's feedback (min-conflicts)
+        # The colors tried for a pin are the ones the guesses had at that position, plus a few random ones in case the right color was never guessed there
+        # When no pin can be improved for a while, the guesses which aren't satisfied yet get a higher weight (the "breakout" method) so that the search leaves that local minimum
+        state = Constraints(self.history, self.random_code())
+        best, best_errors = state.code.copy(), sum(state.errors)
+        stuck = 0
+
+        for step in range(SEARCH_STEPS):
+            if state.total == 0:
+                return state.code
+
+            position = random.randrange(self.code_length)
+            colors = {guess[position] for guess, perfect, partial in self.history if position < len(guess) and guess[position] < self.color_count}
+            colors.update(random.randrange(self.color_count) for i in range(RANDOM_COLORS))
+
+            total, tie, color = min((state.change(position, color, False), random.random(), color) for color in colors) # Ties are broken randomly so that the search doesn't loop
+            stuck = stuck + 1 if total >= state.total else 0
+            if total <= state.total:
+                state.change(position, color, True)
+
+            if stuck > self.code_length: # Every pin was most likely tried without any improvement
+                state.reweight()
+                stuck = 0
+
+            if sum(state.errors) < best_errors:
+                best, best_errors = state.code.copy(), sum(state.errors)
+
+        return best
+
+    def search(self):
+        # Returns a code consistent with the history, or the closest code found if the exact search ran out of time (it then still tells something about the secret code when played)
+        for restart in range(SEARCH_RESTARTS): # Restarting with other random colors is usually faster than insisting on a bad start
+            code = self.backtrack(SEARCH_NODES)
+            if code is not None:
+                return code
+
+        return self.closest()
+
+    def choice(self):
+        return self.random_code() if not self.history else self.search()
+
+    def sample(self, count):
+        # Returns up to count different codes found by the search (fewer if the search keeps finding the same ones)
+        found = {}
+        for i in range(count):
+            code = self.choice()
+            found[tuple(code)] = code
+        return list(found.values())
+
+### END CONSISTENT CODES ###
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+### BEGIN IMPORTS ###
+
+import array
+import bisect
+import collections
+
+### END IMPORTS ###
+
+### BEGIN CONSTANTS ###
+
+BLOCK_SIZE = 1024 # The number of entries per block: a block is split in two once it holds twice as many, so inserting an entry moves at most 2 * BLOCK_SIZE values per column
+
+# The type of each column of an entry (address, username, score, games, total attempts, normalized score, color count, code length, maximum attempts, timestamp), then the insertion order which breaks ties and the record sent to the clients
+# None is a plain list, the others are arrays which take 8 bytes per value instead of a pointer to an object of 24 to 32 bytes
+COLUMN_TYPES = (None, None, "q", "q", "q", "q", "q", "q", "q", "d", "q", None)
+
+PAGE_CACHE_SIZE = 1024 # The number of serialized pages kept, most clients asking for the same first pages after their games
+MAX_PAGE_LENGTH = 65536 - 6 # The data of a packet, without its header, length and footer (see utils.send_packet)
+
+### END CONSTANTS ###
+
+### BEGIN SCOREBOARD ###
+
+def encode_entry(entry):
+    # The record of an entry in the pages sent to the clients (see online_ranked.decode_scoreboard)
+    username = entry[1].encode("utf8")
+    return b"".join((
+        (min(len(username), 0xFFFF) & 0xFFFF).to_bytes(2, "big"),
+        username,
+
+        (min(entry[5], 0xFFFF) & 0xFFFF).to_bytes(2, "big"),
+        (min(entry[3], 0xFFFF) & 0xFFFF).to_bytes(2, "big"),
+        (min(entry[4], 0xFFFF) & 0xFFFF).to_bytes(2, "big"),
+
+        (min(entry[4], 0xFFFF) & 0xFFFF).to_bytes(2, "big"),
+        (min(entry[5], 0xFFFF) & 0xFFFF).to_bytes(2, "big"),
+        (min(entry[6], 0xFFFF) & 0xFFFF).to_bytes(2, "big"),
+
+        (min(int(entry[8] * 1000), 2**64-1) & 2**64-1).to_bytes(8, "big")
+    ))
+
+class ScoreboardBlock:
+    # A run of consecutive entries of the scoreboard, stored column by column
+
+    def __init__(self):
+        self.columns = [[] if column_type is None else array.array(column_type) for column_type in COLUMN_TYPES]
+
+    def __len__(self):
+        return len(self.columns[-1])
+
+    def key(self, index):
+        # The best entries come first: the highest normalized score, then the most games, then the fewest attempts, then the oldest entry
+        columns = self.columns
+        return (-columns[5][index], -columns[3][index], columns[4][index], columns[10][index])
+
+    def bisect(self, key):
+        # The index of the first entry which comes after key
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if key < self.key(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def insert(self, index, values):
+        for i, value in enumerate(values):
+            try:
+                self.columns[i].insert(index, value)
+            except OverflowError: # Normalized scores grow with color_count ** code_length, the few blocks with a value too large for 8 bytes keep that column as a list
+                self.columns[i] = list(self.columns[i])
+                self.columns[i].insert(index, value)
+
+    def entry(self, index):
+        return tuple(column[index] for column in self.columns[:10])
+
+    def split(self):
+        # Moves the second half of the entries to a new block, which is returned
+        half = len(self) // 2
+        block = ScoreboardBlock()
+        for i, column in enumerate(self.columns):
+            block.columns[i] = column[half:]
+            del column[half:]
+        return block
+
+class Scoreboard:
+    # The finished games from the best to the worst, which can be read by position like a list
+    # The entries are kept sorted in blocks, and a Fenwick tree over the sizes of the blocks finds the block of a position, or the position of a block, in O(log n)
+
+    def __init__(self, entries=()):
+        self.blocks = []
+        self.last_keys = [] # The key of the last entry of each block, to find the block an entry goes in
+        self.tree = [0] # The Fenwick tree of the sizes of the blocks, 1-indexed
+        self.count = 0
+        self.next_order = 0
+        self.strings = {} # Every address and username, so that the entries of a player share the same strings
+        self.best = {} # Address -> key of the best entry of that player
+        self.pages = collections.OrderedDict() # (offset, page size, bytes used before the page) -> serialized page, from the least recently used one to the most recent one
+
+        keyed = []
+        for entry in entries:
+            values = self.values(entry)
+            keyed.append(((-values[5], -values[3], values[4], values[10]), values))
+        keyed.sort(key=lambda item: item[0])
+
+        for start in range(0, len(keyed), BLOCK_SIZE):
+            block = ScoreboardBlock()
+            for key, values in keyed[start:start + BLOCK_SIZE]:
+                block.insert(len(block), values)
+                if values[0] not in self.best or key < self.best[values[0]]:
+                    self.best[values[0]] = key
+            self.blocks.append(block)
+            self.last_keys.append(keyed[min(start + BLOCK_SIZE, len(keyed)) - 1][0])
+
+        self.count = len(keyed)
+        self.rebuild_tree()
+
+    def values(self, entry):
+        # The values stored for an entry, with its insertion order appended
+        address, username = self.strings.setdefault(entry[0], entry[0]), self.strings.setdefault(entry[1], entry[1])
+        values = (address, username, *map(int, entry[2:9]), float(entry[9]), self.next_order)
+        self.next_order += 1
+        return values + (encode_entry(values),)
+
+    def rebuild_tree(self):
+        self.tree = [0] * (len(self.blocks) + 1)
+        for i, block in enumerate(self.blocks):
+            self.update_tree(i, len(block))
+
+    def update_tree(self, block_index, delta):
+        i = block_index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def position_of_block(self, block_index):
+        # The number of entries in the blocks before that one
+        position, i = 0, block_index
+        while i > 0:
+            position += self.tree[i]
+            i -= i & -i
+        return position
+
+    def block_of_position(self, position):
+        # The index of the block holding that position, and the index of the entry in that block
+        block_index, step = 0, 1 << (len(self.tree).bit_length() - 1)
+        while step:
+            if block_index + step < len(self.tree) and self.tree[block_index + step] <= position:
+                block_index += step
+                position -= self.tree[block_index]
+            step >>= 1
+        return block_index, position
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for block in self.blocks:
+            for index in range(len(block)):
+                yield block.entry(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+
+            entries = []
+            if start < stop:
+                block_index, entry_index = self.block_of_position(start)
+                while len(entries) < stop - start:
+                    block = self.blocks[block_index]
+                    for i in range(entry_index, min(len(block), entry_index + stop - start - len(entries))):
+                        entries.append(block.entry(i))
+                    block_index, entry_index = block_index + 1, 0
+            return entries
+
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("scoreboard index out of range")
+
+        block_index, entry_index = self.block_of_position(index)
+        return self.blocks[block_index].entry(entry_index)
+
+    def add(self, entry):
+        # Inserts a new entry after the ones which are as good, and returns its position
+        values = self.values(entry)
+        key = (-values[5], -values[3], values[4], values[10])
+
+        if not self.blocks:
+            self.blocks.append(ScoreboardBlock())
+            self.last_keys.append(key)
+            self.rebuild_tree()
+
+        block_index = min(bisect.bisect_right(self.last_keys, key), len(self.blocks) - 1)
+        block = self.blocks[block_index]
+        entry_index = block.bisect(key)
+        block.insert(entry_index, values)
+
+        if entry_index == len(block) - 1:
+            self.last_keys[block_index] = key
+        self.update_tree(block_index, 1)
+        self.count += 1
+
+        if values[0] not in self.best or key < self.best[values[0]]:
+            self.best[values[0]] = key
+
+        position = self.position_of_block(block_index) + entry_index
+
+        for page in [page for page in self.pages if page[0] + page[1] > position]: # Only the pages from the new entry on have changed
+            del self.pages[page]
+
+        if len(block) >= 2 * BLOCK_SIZE:
+            new_block = block.split()
+            self.blocks.insert(block_index + 1, new_block)
+            self.last_keys.insert(block_index, block.key(len(block) - 1))
+            self.rebuild_tree()
+
+        return position
+
+    def page(self, offset, page_size, used=0):
+        # The records of the entries from offset on, as many as fit in a packet which already has used bytes, ready to be sent
+        page = (offset, page_size, used)
+        if page in self.pages:
+            self.pages.move_to_end(page)
+            return self.pages[page]
+
+        records, length = [], used
+        if offset < self.count:
+            block_index, entry_index = self.block_of_position(offset)
+            while len(records) < page_size and block_index < len(self.blocks):
+                block_records = self.blocks[block_index].columns[11]
+                for record in block_records[entry_index:entry_index + page_size - len(records)]:
+                    if length + len(record) > MAX_PAGE_LENGTH:
+                        break
+                    records.append(record)
+                    length += len(record)
+                else:
+                    block_index, entry_index = block_index + 1, 0
+                    continue
+                break
+
+        self.pages[page] = b"".join(records)
+        if len(self.pages) > PAGE_CACHE_SIZE:
+            self.pages.popitem(last=False)
+
+        return self.pages[page]
+
+    def rank(self, address):
+        # The position of the best entry of the player of that address, or None if they never finished a game
+        if address not in self.best:
+            return None
+
+        key = self.best[address]
+        block_index = bisect.bisect_left(self.last_keys, key)
+        return self.position_of_block(block_index) + self.blocks[block_index].bisect(key) - 1
+
+### END SCOREBOARD ###
@@ -2,58 +2,430 @@
 
 import os
 import re
+import sys
 import json
 import time
-import queue
 import errno
+import zlib
 import base64
+import signal
 import socket
+import asyncio
 import threading
 import traceback
+import selectors
 import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+import multiprocessing.managers
 
 import utils
+import scores
+import solver
+import storage
 
-THREAD_COUNT = 16
-PER_THREAD = 8
-MAX_CLIENTS = THREAD_COUNT * PER_THREAD * 2
+try:
+    import resource
+except ImportError: # Only on Unix, elsewhere the number of sockets is limited by the system
+    resource = None
+
+MAX_CLIENTS = 4096 # The number of players connected at once, the next ones wait to be accepted until someone leaves
+
+HINT_REQUESTS = [b"HINT:SIZE", b"HINT:NEXT"] # Odd lengths, so that they can't be mistaken for a guess which takes 2 bytes per pin
+HINT_CACHE_SIZE = 4096 # The number of hints kept for the players who reach the same history, most of them at the beginning of their games
+HINT_PROCESSES = os.cpu_count() or 1
 
 USERNAME_CHARACTERS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-°()[]{}*$€£%!?¡¿&@#/+=÷:;.…,<>§\"' àâæáäãåāçćčéèêëęėēîïìíįīñńôœöòóõōûùüúūÿÀÂÆÁÄÃÅĀÇĆČÉÈÊËĘĖĒÎÏÌÍĮĪÑŃÔŒÖÒÓÕŌÛÙÜÚŪŸ")
 
-def run_thread(pending_clients, user_list, scoreboard):
-    thread = threading.current_thread()
-    clients = []
-    while thread.running:
+hint_cache = collections.OrderedDict() # (request, code length, color count, history) -> answer packet, from the least recently used one to the most recent one
+hint_futures = {} # The hints being computed, so that the players asking the same one at the same time wait for the same computation
+hint_lock = threading.Lock()
+hint_pool = None
+
+ready_clients = collections.deque() # The file descriptors of the clients whose hints were answered, filled by the hint callbacks and emptied by the event loop
+wakeup_receiver, wakeup_sender = None, None # A pair of connected sockets to wake the event loop up when a hint is answered
+
+journal = None # The storage.Journal where every change to the players and the scoreboard is appended, or its proxy in the workers of the multi-process mode
+usernames = {} # Username -> address of every player, so that checking a username doesn't go through every player (in the multi-process mode, a proxy to the one of the manager process as each worker only knows the players it serves)
+
+class StateManager(multiprocessing.managers.SyncManager):
+    # The process owning the usernames and the scoreboard shared by the workers of the multi-process mode
+    pass
+
+StateManager.register("Journal", storage.Journal, exposed=("record_user", "record_attempt", "record_score", "close"))
+StateManager.register("Scoreboard", scores.Scoreboard, exposed=("add", "page", "rank", "__len__", "__getitem__"))
+
+def username_taken(username):
+    return username in usernames
+
+def record_user(user_list, address):
+    if journal is not None:
+        journal.record_user(address, user_list.get(address))
+
+def record_attempt(address, guess):
+    # Only the guess is written for an attempt which doesn't end the game, so that the journal of a game doesn't grow with the square of its attempts
+    if journal is not None:
+        journal.record_attempt(address, guess)
+
+def record_score(entry):
+    if journal is not None:
+        journal.record_score(entry)
+
+def claim_username(username, address):
+    # Returns whether the username was free, in which case it's reserved at once for that address so that two workers can't give it to two players
+    return usernames.setdefault(username, address) == address
+
+def init_hint_process():
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is handled by the server, which shuts the pool down
+    solver.PROCESS_COUNT = 1 # The pool already has a process per core, a hint mustn't start processes of its own
+
+def request_hint(request, game):
+    # Returns a future of the answer packet to the hint request for the current game, computed in other processes not to stall the event loop
+    global hint_pool
+
+    history = tuple((tuple(attempt), *utils.compare_codes(attempt, game["code"])) for attempt in game["attempts"])
+    key = (request, len(game["code"]), game["color_count"], history)
+
+    with hint_lock:
+        if key in hint_cache:
+            hint_cache.move_to_end(key)
+            future = concurrent.futures.Future()
+            future.set_result(hint_cache[key])
+            return future
+
+        if key in hint_futures:
+            return hint_futures[key]
+
+        if hint_pool is None:
+            # Spawned rather than forked from the event loop, which would give the hint processes a copy of every client socket so that closing one wouldn't end its connection
+            hint_pool = concurrent.futures.ProcessPoolExecutor(HINT_PROCESSES, mp_context=multiprocessing.get_context("spawn"), initializer=init_hint_process)
+
+        future = hint_pool.submit(solver.hint, len(game["code"]), game["color_count"], utils.DEFAULT_STRATEGY, [(list(guess), perfect, partial) for guess, perfect, partial in history])
+        answer = concurrent.futures.Future()
+        hint_futures[key] = answer
+
+    def done(future):
         try:
-            while len(clients) < PER_THREAD:
-                conn, address = pending_clients.get(False)
-                conn.settimeout(0)
-                data = {
-                    "status": 300,
-                    "inputs": []
-                }
-                clients.append((conn, address, data))
-                print("Client {}:{} connected on thread #{}.".format(*address, thread.ident))
-        except queue.Empty:
-            pass
+            count, guess = future.result()
+        except Exception as e:
+            print(e)
+            packet = b"HINT:FAIL"
+        else:
+            if request == b"HINT:SIZE":
+                packet = request + min(count, 2**64-1).to_bytes(8, "big")
+            else:
+                packet = request + b"".join((min(color, 0xFFFF) & 0xFFFF).to_bytes(2, "big") for color in guess)
+
+        with hint_lock:
+            del hint_futures[key]
+            if packet != b"HINT:FAIL":
+                hint_cache[key] = packet
+                if len(hint_cache) > HINT_CACHE_SIZE:
+                    hint_cache.popitem(last=False)
+
+        answer.set_result(packet)
 
-        for conn, address, data in clients:
-            if not tick_client(conn, address, data, user_list, scoreboard):
-                clients.remove((conn, address, data))
+    future.add_done_callback(done)
+    return answer
 
-        time.sleep(0.1)
+def wake_up(fileno):
+    # Tells the event loop to tick that client, from the threads of the hint pool
+    if wakeup_sender is None: # In the asyncio mode, the coroutine of the client waits for its hints itself
+        return
+
+    ready_clients.append(fileno)
+    try:
+        wakeup_sender.send(b"\0")
+    except (BlockingIOError, OSError): # The event loop already has bytes to read, or it's closed
+        pass
 
-    for conn, address, data in clients:
+def serve(server_socket, user_list, scoreboard, accept=socket.socket.accept):
+    # A single event loop: clients are only ticked when their socket has data, when their hints are answered, or while they replay the attempts of a resumed game
+    # The new clients are taken from the server socket with accept, which the workers of the multi-process mode replace to receive them from their parent
+    selector = selectors.DefaultSelector()
+    selector.register(server_socket, selectors.EVENT_READ)
+    selector.register(wakeup_receiver, selectors.EVENT_READ)
+
+    clients = {} # File descriptor -> (conn, address, data), the descriptors being registered rather than the sockets so that they can be unregistered once closed
+    replaying = set() # The clients which have inputs left, ticked without waiting for their socket
+
+    try:
+        while True:
+            ticked = set(replaying)
+            for key, mask in selector.select(0 if replaying else None):
+                if key.fileobj is server_socket:
+                    try:
+                        conn, address = accept(server_socket)
+                    except OSError as e: # Out of file descriptors, or the client left before being accepted
+                        print(e)
+                        continue
+
+                    conn.settimeout(0)
+                    data = {
+                        "status": 300,
+                        "inputs": [],
+                        "hints": []
+                    }
+                    clients[conn.fileno()] = (conn, address, data)
+                    selector.register(conn.fileno(), selectors.EVENT_READ)
+                    print("Client {}:{} connected.".format(*address))
+
+                    if len(clients) >= MAX_CLIENTS:
+                        selector.unregister(server_socket)
+                elif key.fileobj is wakeup_receiver:
+                    wakeup_receiver.recv(4096)
+                    while ready_clients:
+                        ticked.add(ready_clients.popleft())
+                else:
+                    ticked.add(key.fileobj)
+
+            for fileno in ticked:
+                if fileno not in clients: # Disconnected since, or a descriptor which was reused
+                    continue
+
+                conn, address, data = clients[fileno]
+                if tick_client(conn, address, data, user_list, scoreboard):
+                    if data["inputs"]:
+                        replaying.add(fileno)
+                    else:
+                        replaying.discard(fileno)
+                else:
+                    selector.unregister(fileno) # Before closing the socket, or epoll would keep watching it while another process still has it open
+                    conn.close()
+                    del clients[fileno]
+                    replaying.discard(fileno)
+
+                    if len(clients) == MAX_CLIENTS - 1:
+                        selector.register(server_socket, selectors.EVENT_READ)
+    except (KeyboardInterrupt, EOFError): # Stopped, or the parent of the worker is gone
+        pass
+
+    for conn, address, data in clients.values():
         conn.close()
-        user_list[address[0]]["connected"] = False
-        clients.remove((conn, address, data))
+        if address[0] in user_list:
+            user_list[address[0]]["connected"] = False
+
+    selector.close()
+
+def worker_for(address, worker_count):
+    # Every client of an address is served by the same worker, so that it alone knows whether that player is already connected
+    return zlib.crc32(address.encode("utf8")) % worker_count
+
+def receive_client(channel):
+    # Takes a client accepted by the parent of the worker, with its address, in place of server_socket.accept()
+    message, fds, flags, _ = socket.recv_fds(channel, 1024, 1)
+    if not message:
+        raise EOFError("the parent of the worker closed its channel")
+    if not fds:
+        raise OSError("received no client from the parent of the worker")
+
+    address = tuple(json.loads(message.decode("utf8")))
+    return socket.socket(fileno=fds[0]), address
+
+def run_worker(channel, inherited, user_list, scoreboard, shared_usernames, shared_journal, results, worker_count):
+    # A worker of the multi-process mode, serving the players of its addresses with the usual event loop
+    global journal, usernames, wakeup_receiver, wakeup_sender, HINT_PROCESSES
+
+    for sock in inherited: # The sockets of the parent copied by the fork, which would keep the channels of the workers open if the parent closed or lost them
+        sock.close()
+
+    journal = shared_journal
+    usernames = shared_usernames
+    HINT_PROCESSES = max(1, HINT_PROCESSES // worker_count) # The workers share the cores for their hints too
+
+    wakeup_receiver, wakeup_sender = socket.socketpair()
+    wakeup_receiver.setblocking(False)
+    wakeup_sender.setblocking(False)
+
+    serve(channel, user_list, scoreboard, accept=receive_client)
+
+    if hint_pool is not None:
+        hint_pool.shutdown()
+
+    channel.close()
+    wakeup_receiver.close()
+    wakeup_sender.close()
+
+    results.update(user_list) # Sent back to the parent which saves them, no other worker having changed these players
+
+def serve_processes(server_socket, user_list, scoreboard, segment, worker_count):
+    # Accepts the clients and passes each of them to the worker of its address, while the usernames and the scoreboard live in a manager process shared by all of them
+    manager = StateManager()
+    manager.start()
+
+    shared_scoreboard = manager.Scoreboard(scoreboard)
+    shared_journal = manager.Journal(segment)
+    shared_usernames = manager.dict(usernames)
+    results = manager.dict()
+
+    partitions = [{} for i in range(worker_count)]
+    for address in user_list:
+        partitions[worker_for(address, worker_count)][address] = user_list[address]
+
+    channels, workers = [], []
+    for i in range(worker_count):
+        channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        worker = multiprocessing.get_context("fork").Process(target=run_worker, args=[worker_channel, [server_socket, channel] + channels, partitions[i], shared_scoreboard, shared_usernames, shared_journal, results, worker_count])
+        worker.start()
+        worker_channel.close()
+
+        channels.append(channel)
+        workers.append(worker)
+
+    try:
+        while True:
+            conn, address = server_socket.accept()
+            try:
+                socket.send_fds(channels[worker_for(address[0], worker_count)], [json.dumps(address).encode("utf8")], [conn.fileno()])
+            except OSError as e: # The worker is gone, the client will have to reconnect
+                print(e)
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+
+    for channel in channels: # Stops the workers which weren't interrupted themselves
+        channel.close()
+
+    for worker in workers:
+        worker.join()
+
+    user_list.update(results.copy()) # The players of a worker which crashed are kept as they were at startup
+    scoreboard = shared_scoreboard[:]
+    shared_journal.close()
+    manager.shutdown()
+
+    return user_list, scoreboard
+
+class StreamConnection:
+    # Looks like a non-blocking socket to tick_client, but reads from the bytes received by the coroutine of the client and writes to its asyncio stream
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.buffer = bytearray()
+        self.eof = False
+        self.closed = False
+
+    def fileno(self):
+        return self.writer.get_extra_info("socket").fileno()
+
+    def recv(self, size):
+        if not self.buffer:
+            if self.eof or self.closed:
+                return bytes()
+            raise BlockingIOError(errno.EWOULDBLOCK, "no data received yet")
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def send(self, data):
+        if self.closed:
+            raise BrokenPipeError(errno.EPIPE, "connection was closed")
+
+        self.writer.write(data) # Only buffered, the coroutine waits for it to be sent with drain() before reading anything else
+        return len(data)
+
+    def has_packet(self):
+        # Whether a whole packet was received, so that receive_packet doesn't consume half of it (anything else than a packet is left to receive_packet to skip)
+        if self.eof or len(self.buffer) < len(utils.HEADER) + 2 or self.buffer[:len(utils.HEADER)] != utils.HEADER:
+            return bool(self.buffer) or self.eof
+
+        length = int.from_bytes(self.buffer[len(utils.HEADER):len(utils.HEADER) + 2], "big")
+        return len(self.buffer) >= length
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+async def serve_stream(reader, writer, user_list, scoreboard):
+    # The coroutine of a single client: it ticks it whenever a whole packet was received or one of its hints was answered, and waits for its answers to be sent before going on
+    conn = StreamConnection(writer)
+    address = writer.get_extra_info("peername")[:2]
+    data = {
+        "status": 300,
+        "inputs": [],
+        "hints": []
+    }
+    print("Client {}:{} connected.".format(*address))
+
+    read = None
+    try:
+        while True:
+            if not data["inputs"] and not conn.has_packet():
+                if read is None:
+                    read = asyncio.ensure_future(reader.read(65536))
+
+                waiting = {read}
+                if data["hints"]:
+                    waiting.add(asyncio.wrap_future(data["hints"][0]))
+                await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                if read.done():
+                    chunk = read.result()
+                    read = None
+
+                    if chunk:
+                        conn.buffer += chunk
+                    else:
+                        conn.eof = True
+                elif not conn.buffer: # Only a hint was answered, which tick_client sends before finding nothing to read
+                    alive = tick_client(conn, address, data, user_list, scoreboard)
+                    await writer.drain()
+                    if not alive:
+                        break
+                    continue
+
+            alive = tick_client(conn, address, data, user_list, scoreboard)
+            await writer.drain()
+            if not alive:
+                break
+    except (OSError, asyncio.CancelledError): # The client left while its answers were being sent, or the server is shutting down
+        if address[0] in user_list and "connected" in user_list[address[0]] and user_list[address[0]]["connected"]:
+            user_list[address[0]]["connected"] = False
+    finally:
+        if read is not None:
+            read.cancel()
+        conn.close()
+
+async def serve_asyncio(user_list, scoreboard):
+    # Every client runs as its own coroutine, so that the number of players is only limited by the number of file descriptors
+    tasks = set()
+
+    async def handle(reader, writer):
+        task = asyncio.current_task()
+        tasks.add(task)
+        try:
+            await serve_stream(reader, writer, user_list, scoreboard)
+        finally:
+            tasks.discard(task)
+
+    server = await asyncio.start_server(handle, "0.0.0.0", utils.SERVER_PORT, backlog=MAX_CLIENTS)
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 def tick_client(conn, address, data, user_list, scoreboard):
+    # Returns whether the client is still connected, otherwise its caller stops watching its socket and closes it
     try:
+        while data["hints"] and data["hints"][0].done(): # The hints are answered in the order they were asked, by the event loop so that it's the only one writing to the sockets
+            utils.send_packet(conn, data["hints"].pop(0).result())
+
         buff = data["inputs"].pop(0) if data["inputs"] else utils.receive_packet(conn)
 
         if buff:
-            if data["status"] == 200:
+            if data["status"] == 200 and buff in HINT_REQUESTS:
+                hint = request_hint(buff, user_list[address[0]]["game"])
+                fileno = conn.fileno()
+                hint.add_done_callback(lambda future: wake_up(fileno))
+                data["hints"].append(hint)
+
+            elif data["status"] == 200:
                 game = user_list[address[0]]["game"]
 
                 guess = [0xFFFF] * len(game["code"])
@@ -72,9 +444,10 @@ def tick_client(conn, address, data, user_list, scoreboard):
                     game["games"] += 1
                     game["code"] = utils.generate_code(len(game["code"]), game["color_count"])
                     game["attempts"] = []
+                    record_user(user_list, address[0])
 
                     if utils.DEBUG:
-                        print("Client {}:{} won a game on thread #{}.".format(*address, thread.ident))
+                        print("Client {}:{} won a game.".format(*address))
                 else:
                     game["attempts"].append(guess)
                     if len(game["attempts"]) >= game["max_attempts"]:
@@ -88,28 +461,26 @@ def tick_client(conn, address, data, user_list, scoreboard):
                         normalized_score = int(normalized_score)
 
                         entry = (address[0], user_list[address[0]]["username"], game["score"], game["games"], total_attempts, normalized_score, game["color_count"], len(game["code"]), game["max_attempts"], time.time())
-                        for i, other in enumerate(scoreboard):
-                            if other[5] < entry[5] or (other[5] == entry[5] and other[3] < entry[3] or (other[3] == entry[3] and other[4] > entry[4])):
-                                scoreboard.insert(i, entry)
-                                break
-                        else:
-                            scoreboard.append(entry)
+                        scoreboard.add(entry)
+                        record_score(entry)
 
                         del user_list[address[0]]["game"]
                         user_list[address[0]]["connected"] = False
+                        record_user(user_list, address[0])
                         data["status"] = 204
                         utils.send_packet(conn, data["status"].to_bytes(2, "big"))
 
                         if utils.DEBUG:
-                            print("Client {}:{} lost a game on thread #{}.".format(*address, thread.ident))
+                            print("Client {}:{} lost a game.".format(*address))
+                    else:
+                        record_attempt(address[0], guess)
 
             elif address[0] in user_list and "connected" in user_list[address[0]] and user_list[address[0]]["connected"]:
                 data["status"] = 409
                 utils.send_packet(conn, data["status"].to_bytes(2, "big"))
-                conn.close()
 
                 if utils.DEBUG:
-                    print("Client {}:{} forcefully disconnected from thread #{}.".format(*address, thread.ident))
+                    print("Client {}:{} forcefully disconnected.".format(*address))
 
                 return False
 
@@ -117,29 +488,16 @@ def tick_client(conn, address, data, user_list, scoreboard):
                 token = buff.decode("utf8")
                 if re.match(r"^SB:\d+ \d+$", token):
                     page_size, offset = map(int, token[3:].split())
-                    answer_bytes = bytes()
-
-                    if len(scoreboard) >= offset:
-                        for entry in scoreboard[offset:min(offset + page_size, len(scoreboard))]:
-                            username = entry[1].encode("utf8")
-
-                            if 6 + len(answer_bytes) + len(username) + 6 > 65535:
-                                break
-
-                            answer_bytes += (min(len(username), 0xFFFF) & 0xFFFF).to_bytes(2, "big")
-                            answer_bytes += username
-
-                            answer_bytes += (min(entry[5], 0xFFFF) & 0xFFFF).to_bytes(2, "big")
-                            answer_bytes += (min(entry[3], 0xFFFF) & 0xFFFF).to_bytes(2, "big")
-                            answer_bytes += (min(entry[4], 0xFFFF) & 0xFFFF).to_bytes(2, "big")
-
-                            answer_bytes += (min(entry[4], 0xFFFF) & 0xFFFF).to_bytes(2, "big")
-                            answer_bytes += (min(entry[5], 0xFFFF) & 0xFFFF).to_bytes(2, "big")
-                            answer_bytes += (min(entry[6], 0xFFFF) & 0xFFFF).to_bytes(2, "big")
-
-                            answer_bytes += (min(int(entry[8] * 1000), 2**64-1) & 2**64-1).to_bytes(8, "big")
+                    utils.send_packet(conn, scoreboard.page(offset, page_size))
+                elif re.match(r"^SB:ME \d+$", token): # The rank of the player, the position of the first entry sent, and the entries around the best one of the player
+                    around = int(token[6:])
+                    rank = scoreboard.rank(address[0])
 
-                    utils.send_packet(conn, answer_bytes)
+                    if rank is None:
+                        utils.send_packet(conn, (2**64-1).to_bytes(8, "big") + (0).to_bytes(8, "big"))
+                    else:
+                        offset = max(0, rank - around)
+                        utils.send_packet(conn, rank.to_bytes(8, "big") + offset.to_bytes(8, "big") + scoreboard.page(offset, rank - offset + around + 1, 16))
                 else:
                     gamemode, score, games, color_count, max_attempts, code, attempts = utils.decode_token(token)
 
@@ -157,6 +515,7 @@ def tick_client(conn, address, data, user_list, scoreboard):
                         "attempts": []
                     }
                     user_list[address[0]]["game"] = game
+                    record_user(user_list, address[0])
 
                     if len(attempts) > max_attempts:
                         attempts = attempts[:max_attempts]
@@ -185,7 +544,7 @@ def tick_client(conn, address, data, user_list, scoreboard):
                     utils.send_packet(conn, fake_token.encode("utf8"))
 
                     if utils.DEBUG:
-                        print("Client {}:{} started a new game on thread #{}.".format(*address, thread.ident))
+                        print("Client {}:{} started a new game.".format(*address))
 
             elif data["status"] == 401 or data["status"] == 403:
                 username = buff.decode("utf8")
@@ -193,26 +552,23 @@ def tick_client(conn, address, data, user_list, scoreboard):
                 if buff == b"\x36\x39":
                     for chars in itertools.product(*[[b"\x4e",b"\x6e",b"\xc3\xb1",b"\xc5\x84",b"\xc3\x91",b"\xc5\x83"],[b"\x69",b"\x49",b"\xc3\xae",b"\xc3\xaf",b"\xc3\xac",b"\xc3\xad",b"\xc4\xaf",b"\xc4\xab",b"\xc3\x8e",b"\xc3\x8f",b"\xc3\x8c",b"\xc3\x8d",b"\xc4\xae",b"\xc4\xaa"],[b"\x63",b"\x43",b"\xc3\xa7",b"\xc4\x87",b"\xc4\x8d",b"\xc3\x87",b"\xc4\x86",b"\xc4\x8c"],[b"\x65",b"\x45",b"\xc3\xa9",b"\xc3\xa8",b"\xc3\xaa",b"\xc3\xab",b"\xc4\x99",b"\xc4\x97",b"\xc4\x93",b"\xc3\x89",b"\xc3\x88",b"\xc3\x8a",b"\xc3\x8b",b"\xc4\x98",b"\xc4\x96",b"\xc4\x92"]]):
                         username = "".join(map(lambda x: x.decode("utf8"), chars))
-                        for other_address in user_list:
-                            if username == user_list[other_address]["username"]:
-                                data["status"] = 403
-                                utils.send_packet(conn, data["status"].to_bytes(2, "big"))
-                                break
+                        if username_taken(username):
+                            data["status"] = 403
+                            utils.send_packet(conn, data["status"].to_bytes(2, "big"))
                         else:
                             break
                     else:
                         username = ""
 
                 if 3 <= len(username) <= 32 and set(username) <= USERNAME_CHARACTERS:
-                    for other_address in user_list:
-                        if username == user_list[other_address]["username"]:
-                            data["status"] = 403
-                            utils.send_packet(conn, data["status"].to_bytes(2, "big"))
-                            break
+                    if not claim_username(username, address[0]):
+                        data["status"] = 403
+                        utils.send_packet(conn, data["status"].to_bytes(2, "big"))
                     else:
                         user_list[address[0]] = {
                             "username": username
                         }
+                        record_user(user_list, address[0])
                         data["status"] = 204
                         utils.send_packet(conn, data["status"].to_bytes(2, "big"))
                 else:
@@ -229,6 +585,7 @@ def tick_client(conn, address, data, user_list, scoreboard):
 
                                 attempts = game["attempts"]
                                 game["attempts"] = []
+                                record_user(user_list, address[0]) # The attempts are journaled again as they're replayed
 
                                 if len(attempts) > game["max_attempts"]:
                                     attempts = attempts[:game["max_attempts"]]
@@ -258,7 +615,7 @@ def tick_client(conn, address, data, user_list, scoreboard):
                                 utils.send_packet(conn, fake_token.encode("utf8"))
 
                                 if utils.DEBUG:
-                                    print("Client {}:{} resumed a game on thread #{}.".format(*address, thread.ident))
+                                    print("Client {}:{} resumed a game.".format(*address))
                             else:
                                 data["status"] = 204
                                 utils.send_packet(conn, data["status"].to_bytes(2, "big"))
@@ -266,10 +623,9 @@ def tick_client(conn, address, data, user_list, scoreboard):
                         else:
                             data["status"] = 409
                             utils.send_packet(conn, data["status"].to_bytes(2, "big"))
-                            conn.close()
 
                             if utils.DEBUG:
-                                print("Client {}:{} forcefully disconnected from thread #{}.".format(*address, thread.ident))
+                                print("Client {}:{} forcefully disconnected.".format(*address))
 
                             return False
                     else:
@@ -284,10 +640,8 @@ def tick_client(conn, address, data, user_list, scoreboard):
                 data += conn.recv(65536 - len(e.skipped_data))
                 if re.match(r"^GET .*? HTTP/\d+(?:\.\d+)*\r\n", data.decode("utf8")):
                     conn.send(base64.b64decode("SFRUUC8xLjEgMjAwIE9LDQpDb250ZW50LVR5cGU6aW1hZ2UvZ2lmDQpDb25uZWN0aW9uOmNsb3NlZA0KDQpHSUY4OWEQAA4A8gAA/wEqFf5J4esIoOc5K+7IycenAAAAAAAAIfkECQQAAAAh/hlPcHRpbWl6ZWQgdXNpbmcgZXpnaWYuY29tACH/C05FVFNDQVBFMi4wAwEAAAAh/wt4bXAgZGF0YXhtcP8/eHBhY2tldCBiZWdpbj0i77u/IiBpZD0iVzVNME1wQ2VoaUh6cmVTek5UY3prYzlkIj8+IDx4OnhtcG10YSB4bWxuczp4PSJhZG9iZTpuczptZXRhLyIgeDp4bXB0az0iQWRvYmUgWE1QIENvcmUgNS4zLWMwMTEgNjYuMTQ1NjYxLCAyMDEyLzAyLzA2LTE0OjU2OjI3ICAgICAgICAiPjxyZGY6UkRGIHhtbG5zOnJkZj0iaHR0cDovL3d3dy53Lm9yZy8xOTk5LzAyLzIyLXJkZi1zeW50YXgtbnMjIj4gPHJkZjpEZXNjcmlwdGlvbiByZjphYm91dD0iIiD/eG1sbnM6eG1wPSJodHRwOi8vbnMuYWRvYmUuY29tL3hhcC8xLjAvIiB4bWxuczp4bXBNTT0iaHR0cDovL25zLmFkb2JlLmNvbS94YXAvMS4wL21tLyIgeG1uczpzdFJlZj0iaHR0cDovL25zLmFkb2JlLmNvbS94YXAvMS4wL3NUeXBlL1Jlc291cmNlUmVmIyIgeG1wOkNyZWF0b3JUb29sPSJBZG9iZSBQaG90b3Nob3AgQ1M2ICgxMy4wIDIwMTIwMzAubS40MTUgMjAxMi8wMy8wNToyMTowMDowMCkgIChNYWNpbnRvc2gpIiB4bXBNTTpJbnN0YWNlSUQ9/yJ4bXAuaWlkOjNFMDkxQkU1N0I3NTExRTE5QkY3ODJBQjU0NUZGMkI2IiB4bXBNTTpEb2N1bWVudElEPSJ4bXAuZGlkOjNFMDkxQkU2N0I3NTExRTE5QkY3ODJBQjU0NUZGMkI2Ij4gPG1wTU06RGVyaXZlZEZyb20gc3RSZWY6aW5zdGFuY2VJRD0ieG1wLmlpZDozRTA5MUJFMzdCNzUxMUUxOUJGNzgyQUI1NDVGRjJCNiIgc3RSZWY6ZG9jdW1lbnRJRD0ieG1wLmRpZDozRTA5MUJFNDdCNzUxMUUxOUY3ODJBQjU0NUZGMkI2Ii8+IDwvcmRmOkRlc2Nyaf9wdGlvbj4gPC9yZGY6UkRGPiA8L3g6eG1wbWV0YT4gPD94cGFrZXQgZW5kPSJyIj8+Af/+/fz7+vn49/b19PPy8fDv7u3s6+rp6Ofm5eTj4uHg397d3Nva2djX1tXU09LR0M/OzczLysnIx8bFxMPCwcC/vr28u7q5uLe2tbSzsrGwr66trKupqKempaSjoqGgn56dnJuamZiXlpWUk5KRkI+OjYyLiomIh4aFhIOCgYB/fn18e3p5eHd2dXRzcnFwb25tbGtqaWhnZmVkY2JhYF9eXVxbWllYV1ZVVFNSUVBPTk1MS0pJSEdGRURDQkFAPz49PDs6OTg3NjU0MzIyMTAvLi0sKyopKCcmJSQjIiEgHx4dHBsaGRgXFhUUExIREA8ODQwLCgkIBwYFBAMCAQAALAAAAAAQAA4AAAM7CLoM1I08EMKAKsgtMdVcB1XhNpYcM5DopAgryGkqXIF3I+yxVF2LwW4IiwEBKyGRWFAIlUviK0oFJAAAIfkECQQAAAAsAAAAAA8ADgCCAAAAKv4jqvgVGUf7ENfjsaXCAAAAAAAAAz8IukvEjIwBHClQuSKHy5UzeRO2cOJkUY2Vjkzgjmosz96zBLdrMQVez2JSCI5HIa9YQCKVAWPAmVQaqVWhIAEAIfkECQQAAAAsAQAAAA8ADgCCAAAAD/9BLDf5BdTlRu6/nbKwAAAAAAAAAzsIuiO1sBUhmoCMao3B+BsXhVtkkRQDopfyrSRDEDAIFUH+vg+U/7oBoacA5miDXC9pnAUIOQXUSA0AEgAh+QQJBAAAACwAAAAAEAAOAIIAAABMOfbGGvIG2udG7r9D338AAAAAAAADQgi6EPxACBUCgdSKsCeulSR6DCiaDxGGIwkMIDdWzACbUljbcfzYvN6FUbARgLwhkVAoHJE2YrMIHTAXzGbV5gQkAAAh+QQJBAAAACwAAAEADwANAIIAAAA5PfjdCN/WaMAEy/fgWIMAAAAAAAADOQi6MvugFTBEg9RW7WAIVjNsXmiGDxiORWGlqlaQyxef8L2mBGFbn46iR7TZCAti0RhAApQ9ZhOZAAAh+QQJBAAAACwAAAEADgANAIIAAADtR3H+EzBJLffbI9LJx6cAAAAAAAADOAi6EMUrBEXIhFYGISSuXLddFBFyGmmJZ7dUUuuW2ekBxFCtnUVQg2AmsHsogkjh7phsIgHOKCABACH5BAkEAAAALAAAAQANAA0AggAAAPk0O/q5BN0a2nVK7wAAAAAAAAAAAAMtCLrcHuGJCSEbNcx5M9UL5mlCBIjQRiko+bFtZg5xxhJ0PJwD4eO5He/nCwISACH5BAkEAAAALAAAAQAPAA0AggAAAPY8Q+DbBvG9CvIL08nHpwAAAAAAAAM7CLoswu2BMESBqhYnKg4UJ0JgJZpMwJnjErKtAoaik87s4MlEr1cDygUgCPR6s9nQeGyCHkVQ8ygFJAAAIfkECQQAAAAsAAABABAADQCCAAAA/SgnN/4K190Gu+EazqatAAAAAAAAAzsIugxTjREBByEwDlummJGzeRTYjML3TdliXWRKNMEbX/T2ysTADIEa7ML5BYM6XQt4bCIVOqdUJJ0CEgAh+QQFBAAAACwAAAAAEAAOAIIAAAD+QwQm/hsI/l3D2R1G7r8AAAAAAAADPwi63K5lifHULFjgSrT4Q+gQHTiAEUN+aDE1pRZmAhyH4WfH7KuSvE5KQQoEgEjComhsIlPIphFJJBylThIgAQA7"))
-                    conn.close()
-
                     if utils.DEBUG:
-                        print("Client {}:{} disconnected from thread #{}.".format(*address, thread.ident))
+                        print("Client {}:{} disconnected.".format(*address))
 
                     return False
 
@@ -304,66 +658,102 @@ def tick_client(conn, address, data, user_list, scoreboard):
             print(e)
         pass
 
-    conn.close()
-
     if address[0] in user_list and "connected" in user_list[address[0]] and user_list[address[0]]["connected"]:
         user_list[address[0]]["connected"] = False
 
     if utils.DEBUG:
-        print("Client {}:{} disconnected from thread #{}.".format(*address, thread.ident))
+        print("Client {}:{} disconnected.".format(*address))
 
     return False
 
-server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server_socket.bind(("0.0.0.0", utils.SERVER_PORT))
-server_socket.listen(MAX_CLIENTS)
+def main():
+    global journal, usernames, wakeup_receiver, wakeup_sender
 
-pending_clients = queue.Queue(maxsize=MAX_CLIENTS)
+    if len(sys.argv) > 1 and sys.argv[1] == "processes" and not hasattr(socket, "send_fds"): # Passing the clients to the workers needs Python 3.9 or later, on Unix
+        print("The multi-process mode needs Python 3.9 or later on Unix")
+        return
 
-if os.path.isfile("user_list.json"):
-    with open("user_list.json", "r") as file:
-        user_list = json.load(file)
-else:
-    user_list = {}
+    state = storage.load()
+    if state is not None: # The snapshot and the journal segments written since
+        user_list, usernames, entries, segment = state
+    else: # The files saved at shutdown by older versions
+        if os.path.isfile("user_list.json"):
+            with open("user_list.json", "r") as file:
+                user_list = json.load(file)
+        else:
+            user_list = {}
 
-if os.path.isfile("scoreboard.csv"):
-    scoreboard = []
-    with open("scoreboard.csv", "r") as file:
-        for line in file.readlines():
-            try:
-                entry = list(map(lambda x: x.replace("„", ","), line.split(",")))
-                entry[2:9] = map(int, entry[2:9])
-                entry[9] = float(entry[9])
-                scoreboard.append(entry)
-            except:
-                pass
-else:
-    scoreboard = []
-
-threads = []
-for i in range(THREAD_COUNT):
-    thread = threading.Thread(target=run_thread, args=[pending_clients, user_list, scoreboard])
-    thread.running = True
-    thread.start()
-    threads.append(thread)
+        entries = []
+        if os.path.isfile("scoreboard.csv"):
+            with open("scoreboard.csv", "r") as file:
+                for line in file.readlines():
+                    try:
+                        entry = list(map(lambda x: x.replace("„", ","), line.split(",")))
+                        entry[2:9] = map(int, entry[2:9])
+                        entry[9] = float(entry[9])
+                        entries.append(entry)
+                    except:
+                        pass
 
-try:
-    while True:
-        conn, address = server_socket.accept()
-        pending_clients.put((conn, address))
-except:
-    for thread in threads:
-        thread.running = False
+        usernames = {user_list[address]["username"]: address for address in user_list}
+
+        segment = 0
+        storage.save_snapshot(user_list, usernames, entries, segment - 1)
+
+    for address in user_list: # Nobody is connected yet, even if the server crashed while they were
+        user_list[address]["connected"] = False
+
+    scoreboard = scores.Scoreboard(entries)
+    del entries
+
+    if resource is not None: # Every player takes a file descriptor, and the default limit is often 1024
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = MAX_CLIENTS + 64 if hard == resource.RLIM_INFINITY else min(MAX_CLIENTS + 64, hard)
+        if soft != resource.RLIM_INFINITY and soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    if len(sys.argv) < 2 or sys.argv[1] != "processes": # The workers of the multi-process mode share a journal owned by their manager process
+        journal = storage.Journal(segment)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "asyncio": # Each client as a coroutine of an asyncio server, rather than ticked by the selectors loop
+        try:
+            asyncio.run(serve_asyncio(user_list, scoreboard))
+        except KeyboardInterrupt:
+            pass
+    else:
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.bind(("0.0.0.0", utils.SERVER_PORT))
+        server_socket.listen(MAX_CLIENTS)
+
+        if len(sys.argv) > 1 and sys.argv[1] == "processes": # The clients spread over several worker processes, each with its own event loop
+            worker_count = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+            user_list, scoreboard = serve_processes(server_socket, user_list, scoreboard, segment, worker_count)
+        else:
+            wakeup_receiver, wakeup_sender = socket.socketpair()
+            wakeup_receiver.setblocking(False)
+            wakeup_sender.setblocking(False)
+
+            serve(server_socket, user_list, scoreboard)
+
+            wakeup_receiver.close()
+            wakeup_sender.close()
+
+        server_socket.close()
+
+    if hint_pool is not None:
+        hint_pool.shutdown()
 
-    for thread in threads:
-        thread.join()
+    if journal is not None:
+        journal.close()
 
-server_socket.close()
+    # Still written for reading them, but the next start loads the snapshot
+    with open("user_list.json", "w") as file:
+        json.dump(user_list, file)
 
-with open("user_list.json", "w") as file:
-    json.dump(user_list, file)
+    with open("scoreboard.csv", "w") as file:
+        file.write("id,username,score,games,total attempts,normalized score,color count,code length,maximum attempts,timestamp\n")
+        for entry in scoreboard:
+            file.write(",".join(map(lambda x: str(x).replace(",", "„"), entry)) + "\n")
 
-with open("scoreboard.csv", "w") as file:
-    file.write("id,username,score,games,total attempts,normalized score,color count,code length,maximum attempts,timestamp\n")
-    for entry in scoreboard:
-        file.write(",".join(map(lambda x: str(x).replace(",", "„"), entry)) + "\n")
+if __name__ == "__main__":
+    main()
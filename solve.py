@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+
+import utils
+import solver
+
+def solve(code, color_count, max_attempts, strategy):
+    # Plays one game of the computer against the given secret code, and returns the list of (guess, perfect, partial) it played
+    # The states reached by the previous games are cached by the solver (see solver.game_state), so the common first guesses are only computed once
+    matrix = solver.get_feedback_matrix(len(code), color_count)
+    history = []
+
+    for i in range(max_attempts):
+        guess = solver.state_guess(matrix, strategy, history)
+        perfect, partial = solver.compare(matrix, guess, code)
+        history.append((guess, perfect, partial))
+
+        if perfect == len(code):
+            break
+
+    return history
+
+def parse_game(line, defaults):
+    # A line is either the colors of the secret code separated by spaces or commas (e.g. "0 1 1 3"), which is played with the defaults,
+    # or a JSON object such as {"code": [0, 1, 1, 3], "color_count": 6, "max_attempts": 12, "strategy": "minimax"}, where only the code is mandatory
+    line = line.strip()
+
+    if line.startswith("{"):
+        game = dict(defaults, **json.loads(line))
+    else:
+        game = dict(defaults, code=[int(color) for color in line.replace(",", " ").split()])
+
+    if type(game["color_count"]) is not int or type(game["max_attempts"]) is not int: # type() rather than isinstance() so that true and false aren't taken for 1 and 0
+        raise ValueError("the number of colors and of attempts must be integers")
+    if not isinstance(game["code"], list) or not game["code"] or not all(type(color) is int and 0 <= color < game["color_count"] for color in game["code"]):
+        raise ValueError("invalid code for {} colors: {}".format(game["color_count"], game["code"]))
+    if game["max_attempts"] < 1:
+        raise ValueError("invalid number of attempts: {}".format(game["max_attempts"]))
+    if game["strategy"] not in solver.STRATEGIES:
+        raise ValueError("unknown strategy: {}".format(game["strategy"]))
+
+    return game
+
+def main():
+    # Usage: python3 solve.py [INPUT] [STRATEGY] [COLOR_COUNT] [MAX_ATTEMPTS]
+    # Reads one game per line from INPUT (or from the standard input if it's "-" or missing), and writes one JSON line per game to the standard output
+    # The lines are read and written one by one, so any number of games can be streamed through it
+    path = sys.argv[1] if len(sys.argv) > 1 else "-"
+    defaults = {
+        "strategy": sys.argv[2] if len(sys.argv) > 2 else utils.DEFAULT_STRATEGY,
+        "color_count": int(sys.argv[3]) if len(sys.argv) > 3 else utils.DEFAULT_COLOR_COUNT,
+        "max_attempts": int(sys.argv[4]) if len(sys.argv) > 4 else utils.DEFAULT_MAX_ATTEMPTS
+    }
+
+    file = sys.stdin if path == "-" else open(path)
+
+    try:
+        for number, line in enumerate(file, 1):
+            if not line.strip() or line.lstrip().startswith("#"): # Empty lines and comments are skipped
+                continue
+
+            try:
+                game = parse_game(line, defaults)
+            except (ValueError, TypeError, KeyError) as e: # Invalid JSON, missing code, colors which aren't numbers...
+                print(json.dumps({"line": number, "error": str(e)}, separators=(",", ":")))
+                continue
+
+            start = time.time()
+            try:
+                history = solve(game["code"], game["color_count"], game["max_attempts"], game["strategy"])
+            except (ValueError, TypeError) as e: # A game which the solver can't play, which shouldn't stop the others
+                print(json.dumps({"line": number, "error": str(e)}, separators=(",", ":")))
+                continue
+            seconds = time.time() - start
+
+            print(json.dumps({
+                "line": number,
+                "code": game["code"],
+                "color_count": game["color_count"],
+                "max_attempts": game["max_attempts"],
+                "strategy": game["strategy"],
+                "guesses": [guess for guess, perfect, partial in history],
+                "attempts": len(history),
+                "solved": history[-1][1] == len(game["code"]),
+                "seconds": round(seconds, 6)
+            }, separators=(",", ":")))
+    except (KeyboardInterrupt, BrokenPipeError): # The output may be piped to a command which stops reading early, like head
+        pass
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+if __name__ == "__main__":
+    main()
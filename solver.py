@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+
+### BEGIN IMPORTS ###
+
+import os
+import json
+import gzip
+import math
+import weakref
+import operator
+import functools
+import collections
+import concurrent.futures
+
+import codes
+import utils
+import sampling
+import candidates
+
+try:
+    import numpy
+except ImportError: # NumPy is optional, without it the codes which don't fit in a feedback matrix are compared one by one
+    numpy = None
+
+### END IMPORTS ###
+
+### BEGIN CONSTANTS ###
+
+MAX_MATRIX_CODES = 4096 # Above this number of codes, the full feedback table would take more than 16 MB so we fall back to comparing codes one by one
+SAMPLING_CODES = 2 ** 27 # Above this number of codes, even one bit per code would take more than 16 MB so consistent codes are searched for instead of listed
+PURE_SAMPLING_CODES = 2 ** 20 # The same without NumPy, as going through every code in Python for each guess takes seconds well before the bitsets take too much memory
+BUCKET_BYTES = 16 * 1024 * 1024 # The memory which can be taken by the possibilities kept in buckets, per feedback matrix
+STATE_BYTES = 64 * 1024 * 1024 # The memory which can be taken by the game states kept in the cache, per feedback matrix
+STATE_OVERHEAD = 2048 # The memory taken by a cached state besides its bitset (its key, its dicts, the set object and the finalizer of its buckets), about 1.7 KB measured on 4x6
+
+BATCH_SIZE = 0x10000 # The number of codes unranked and compared at once by NumPy, to keep the temporary arrays small
+
+SCORED_GUESSES = 400 # Without a feedback matrix, the number of possibilities scored as a guess by the scoring strategies
+SCORED_SECRETS = 1000 # Without a feedback matrix, the number of possibilities used to estimate the partitions made by each guess
+SAMPLED_CODES = 10 # When the codes are too many to be listed, the number of consistent codes searched for and scored against each other
+
+PROCESS_COUNT = os.cpu_count() or 1 # The number of processes scoring guesses in parallel
+PARALLEL_WORK = 250000 # Below this number of (guess, possibility) pairs to score, sending the work to other processes costs more than it saves
+
+STRATEGIES = ["random", "minimax", "expected_size", "entropy", "optimal"]
+BOOK_STRATEGIES = {"optimal": "minimax"} # The strategies which are only played from their opening book (built by optimal.py), and the strategy played instead once the game leaves it
+
+BOOK_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "books") # Where the opening books built by opening_book.py are stored
+
+EQUAL_TABLES = [bytes(int(value == feedback) for value in range(0x100)) for feedback in range(0x100)] # EQUAL_TABLES[feedback] maps that feedback to 1 and every other byte to 0, to be used with bytes.translate
+MIN_TABLES = [bytes(min(count, value) for value in range(0x100)) for count in range(0x100)] # MIN_TABLES[count] maps each byte to min(count, byte), to be used with bytes.translate
+
+### END CONSTANTS ###
+
+### BEGIN FEEDBACK MATRIX ###
+
+def feedback_id(perfect, partial, code_length):
+    # Packs a (perfect, partial) result in a single integer, which fits in one byte as long as the code is at most 15 pins long
+    return perfect * (code_length + 1) + partial
+
+def feedback_from_id(feedback, code_length):
+    return divmod(feedback, code_length + 1)
+
+@functools.lru_cache(maxsize=4)
+def get_feedback_matrix(code_length, color_count):
+    # Codes are identified by their rank (see codes.py), which is also their index in the rows of the matrix
+    size = codes.code_count(code_length, color_count)
+
+    has_table = size <= MAX_MATRIX_CODES and (code_length + 1) ** 2 <= 0x100
+    sampled = size > (SAMPLING_CODES if numpy is not None else PURE_SAMPLING_CODES)
+
+    return {
+        "code_length": code_length,
+        "color_count": color_count,
+        "size": size,
+        "masks": {}, # For each (position, color), one byte per code set to 1 if the code has that color at that position
+        "color_counts": {}, # For each color, one byte per code containing the number of pins of that color in the code
+        "rows": [None] * size if has_table else None, # Each row is the feedback of one guess against every possible secret, computed the first time that guess is played
+        "vectorized": not has_table and not sampled and numpy is not None, # When there is no table, NumPy can still compare the codes in batches
+        "sampled": sampled,
+        "possibilities": None, # The possibilities at the beginning of a game, shared by every game so that the buckets they are split in are too
+        "bucket_bytes": 0, # The size of the bitsets stored in buckets so far, see keep_bucket
+        "states": collections.OrderedDict(), # The game states reached so far, from the least to the most recently used, see game_state
+        "state_bytes": 0,
+        "state_hits": 0,
+        "state_misses": 0
+    }
+
+def position_mask(matrix, position, color):
+    mask = matrix["masks"].get((position, color))
+
+    if mask is None:
+        # In enumeration order, the color at a given position stays the same for blocks of color_count ** (pins on its right) codes
+        block = matrix["color_count"] ** (matrix["code_length"] - position - 1)
+        period = bytes(block * color) + b"\x01" * block + bytes(block * (matrix["color_count"] - color - 1))
+        mask = int.from_bytes(period * (matrix["size"] // len(period)), "little")
+        matrix["masks"][(position, color)] = mask
+
+    return mask
+
+def color_counts(matrix, color):
+    counts = matrix["color_counts"].get(color)
+
+    if counts is None:
+        # Each byte never exceeds the code length, so adding the masks as big integers never carries from one code to the next
+        counts = sum(position_mask(matrix, position, color) for position in range(matrix["code_length"]))
+        counts = counts.to_bytes(matrix["size"], "little")
+        matrix["color_counts"][color] = counts
+
+    return counts
+
+def feedback_row(matrix, guess_index):
+    row = matrix["rows"][guess_index]
+
+    if row is None:
+        code_length = matrix["code_length"]
+        guess = codes.unrank(guess_index, code_length, matrix["color_count"])
+
+        # The whole row is computed at once by treating it as a big integer with one byte per code, which is much faster than comparing codes one by one
+        perfect = sum(position_mask(matrix, position, color) for position, color in enumerate(guess)) # The number of pins which are the same at the same position
+
+        common = 0 # The number of pins which are in both codes, wherever they are
+        for color in set(guess):
+            common += int.from_bytes(color_counts(matrix, color).translate(MIN_TABLES[guess.count(color)]), "little")
+
+        # feedback_id(perfect, common - perfect) is perfect * code_length + common, and it still fits in a byte thanks to the has_table condition
+        row = bytearray((perfect * code_length + common).to_bytes(matrix["size"], "little"))
+        matrix["rows"][guess_index] = row # Several threads may compute the same row at the same time, but they will all store the same result
+
+    return row
+
+def new_possibilities(matrix):
+    # Every code is possible at the beginning of a game, and the possibilities only take one bit per code, or nothing at all when there are too many codes
+    if matrix["sampled"]:
+        return sampling.ConsistentCodes(matrix["code_length"], matrix["color_count"])
+
+    if matrix["possibilities"] is None:
+        matrix["possibilities"] = candidates.CandidateSet(matrix["size"], full=True)
+    return matrix["possibilities"]
+
+def compare(matrix, guess, code):
+    # Same as utils.compare_codes, but the result is looked up in the feedback matrix when there is one
+    code_length, color_count = matrix["code_length"], matrix["color_count"]
+
+    if matrix["rows"] is not None and codes.is_valid_code(guess, code_length, color_count) and codes.is_valid_code(code, code_length, color_count):
+        return feedback_from_id(feedback_row(matrix, codes.rank(guess, color_count))[codes.rank(code, color_count)], code_length)
+    else:
+        return utils.compare_codes(guess, code)
+
+def filter_possibilities(matrix, possibilities, guess, perfect, partial):
+    # Only keeps the possibilities (a set of code ranks) which would have given the same result if they were the secret code
+    code_length, color_count = matrix["code_length"], matrix["color_count"]
+
+    if matrix["sampled"]:
+        return possibilities.filter(guess, perfect, partial) # The feedback is only remembered, to be checked by the codes searched later
+    elif matrix["rows"] is not None and codes.is_valid_code(guess, code_length, color_count): # Resumed games may contain guesses which aren't valid codes, those are compared the slow way
+        # The possibilities are shared by the games which played the same guesses and got the same feedback so far (see new_possibilities),
+        # so the first one to play a guess from them filters them and the next ones only look the result up
+        guess_index, feedback = codes.rank(guess, color_count), feedback_id(perfect, partial, code_length)
+        if possibilities.buckets is not None and possibilities.buckets[0] == guess_index and feedback in possibilities.buckets[1]:
+            return possibilities.buckets[1][feedback]
+
+        row = feedback_row(matrix, guess_index)
+        bucket = possibilities.filter_mask(row.translate(EQUAL_TABLES[feedback]))
+        keep_bucket(matrix, possibilities, guess_index, feedback, bucket)
+        return bucket
+    elif matrix["vectorized"] and len(guess) == code_length:
+        def keep(ranks):
+            batch_perfect, batch_partial = compare_batch(guess, unrank_batch(ranks, code_length, color_count))
+            return (batch_perfect == perfect) & (batch_partial == partial)
+
+        return possibilities.filter_batches(keep, BATCH_SIZE)
+    else:
+        return possibilities.filter(lambda possibility: utils.compare_codes(guess, codes.unrank(possibility, code_length, color_count)) == (perfect, partial))
+
+def partition_possibilities(matrix, possibilities, guess_index):
+    # Splits the possibilities depending on the feedback they would give if they were compared with the guess, returns a dict of feedback id -> possibilities
+    code_length, color_count = matrix["code_length"], matrix["color_count"]
+    partitions = {}
+
+    if matrix["rows"] is not None:
+        row = feedback_row(matrix, guess_index)
+
+        for feedback in set(row): # One masked filter per feedback, which runs in C, rather than a Python loop over the possibilities
+            partition = possibilities.filter_mask(row.translate(EQUAL_TABLES[feedback]))
+            if partition.count:
+                partitions[feedback] = partition
+    elif matrix["vectorized"]:
+        guess = codes.unrank(guess_index, code_length, color_count)
+
+        for ranks in possibilities.batches(BATCH_SIZE):
+            batch_perfect, batch_partial = compare_batch(guess, unrank_batch(ranks, code_length, color_count))
+            feedbacks = batch_perfect.astype(numpy.int64) * (code_length + 1) + batch_partial
+
+            for feedback in numpy.unique(feedbacks):
+                partitions.setdefault(int(feedback), candidates.CandidateSet(matrix["size"])).add_ranks(ranks[feedbacks == feedback])
+    else:
+        guess = codes.unrank(guess_index, code_length, color_count)
+
+        for possibility in possibilities:
+            feedback = feedback_id(*utils.compare_codes(guess, codes.unrank(possibility, code_length, color_count)), code_length)
+            partitions.setdefault(feedback, candidates.CandidateSet(matrix["size"])).add(possibility)
+
+    return partitions
+
+def release_buckets(matrix, kept_bytes):
+    # Gives back the memory of the buckets of a set, when they are replaced or when the set itself is freed
+    matrix["bucket_bytes"] -= kept_bytes[0]
+    kept_bytes[0] = 0
+
+def keep_bucket(matrix, possibilities, guess_index, feedback, bucket):
+    # Remembers that the possibilities give that bucket for that guess and feedback, unless the buckets already take too much memory
+    # Only the buckets of the last guess are kept for each set of possibilities, which is enough for the games which keep playing the same guesses
+    if possibilities.buckets is None:
+        # The bytes are given back when the set is freed too, which also frees its buckets and, one after the other, the buckets of those
+        possibilities.kept_bytes = [0]
+        weakref.finalize(possibilities, release_buckets, matrix, possibilities.kept_bytes)
+    elif possibilities.buckets[0] != guess_index:
+        release_buckets(matrix, possibilities.kept_bytes)
+
+    if possibilities.buckets is None or possibilities.buckets[0] != guess_index:
+        possibilities.buckets = (guess_index, {})
+
+    if matrix["bucket_bytes"] + len(bucket.bits) <= BUCKET_BYTES:
+        possibilities.buckets[1][feedback] = bucket
+        possibilities.kept_bytes[0] += len(bucket.bits)
+        matrix["bucket_bytes"] += len(bucket.bits)
+
+### END FEEDBACK MATRIX ###
+
+### BEGIN BATCH SCORING ###
+
+def unrank_batch(ranks, code_length, color_count):
+    # Vectorized codes.unrank: turns an array of ranks into a 2-D array with one code per row
+    if color_count ** code_length <= 2 ** 31:
+        ranks = ranks.astype(numpy.int32) # Smaller integers are divided much faster
+    dtype = numpy.uint8 if color_count <= 0x100 else numpy.uint16 # Colors are at most 65535 like in the tokens, but most of the time they fit in a byte
+    candidates = numpy.empty((len(ranks), code_length), dtype=dtype, order="F") # The array is stored column by column so that each pin is contiguous in memory
+    for i in range(code_length - 1, -1, -1): # Fill the codes from the least significant pin (the last one) to the most significant one
+        ranks, candidates[:, i] = numpy.divmod(ranks, color_count)
+    return candidates
+
+def compare_batch(guess, candidates):
+    # Batch counterpart of utils.compare_codes: compares one guess with every row of a 2-D array of candidate codes (of the same length as the guess)
+    guess = list(guess)
+    dtype = numpy.uint8 if len(guess) < 0x100 else numpy.uint16 # The counters never go above the code length, and the smaller they are the faster they are to update
+
+    perfect = numpy.zeros(len(candidates), dtype=dtype) # The number of pins which are the same at the same position, for each candidate
+    color_counts = {color: numpy.zeros(len(candidates), dtype=dtype) for color in set(guess)} # Only the colors of the guess can be in common
+
+    for i, color in enumerate(guess):
+        column = candidates[:, i]
+        perfect += column == color
+        for other, counts in color_counts.items():
+            counts += column == other
+
+    common = numpy.zeros(len(candidates), dtype=dtype) # The number of pins which are in both codes, wherever they are
+    for color, counts in color_counts.items(): # Each color counts at most as many times as it is in the guess
+        common += numpy.minimum(counts, guess.count(color))
+
+    return perfect, common - perfect
+
+### END BATCH SCORING ###
+
+### BEGIN SYMMETRIES ###
+
+# The possibilities left after a history don't change if the colors which were never played are swapped with each other, or if two positions which have the same color in every guess are swapped.
+# Two guesses which only differ by such swaps split the possibilities the same way, so only one guess of each class needs to be scored.
+
+def symmetries(code_length, color_count, guesses):
+    # Returns the colors which were played and the blocks of interchangeable positions, or None if no guesses can be swapped
+    if not all(codes.is_valid_code(guess, code_length, color_count) for guess in guesses): # Resumed games may contain invalid guesses, don't try to make sense of them
+        return None
+
+    played = {color for guess in guesses for color in guess}
+    blocks = {}
+    for position in range(code_length):
+        blocks.setdefault(tuple(guess[position] for guess in guesses), []).append(position) # Positions with the same colors in every guess end up in the same block
+
+    if len(blocks) == code_length and color_count - len(played) < 2:
+        return None
+
+    return played, list(blocks.values())
+
+def symmetry_key(code, played, blocks):
+    # Two codes are swapped into each other by the symmetries if and only if they have the same key: up to the order of the positions in each block,
+    # a code is the number of pins of each color in each block, and up to the order of the colors that were never played, it is the multiset of those counts for these colors
+    counts = {}
+    for block_index, block in enumerate(blocks):
+        for position in block:
+            counts.setdefault(code[position], [0] * len(blocks))[block_index] += 1
+
+    fixed = tuple(sorted((color, tuple(block_counts)) for color, block_counts in counts.items() if color in played))
+    free = tuple(sorted(tuple(block_counts) for color, block_counts in counts.items() if color not in played))
+    return fixed, free
+
+@functools.lru_cache(maxsize=64)
+def representative_guesses(code_length, color_count, guesses):
+    # Returns the lowest rank of each class of codes which are the same up to the symmetries left by the guesses (a tuple of codes as tuples), or None if there are no symmetries
+    group = symmetries(code_length, color_count, guesses)
+    if group is None:
+        return None
+
+    seen = set()
+    ranks = []
+    for index, code in enumerate(codes.iterate_codes(code_length, color_count)):
+        key = symmetry_key(code, *group)
+        if key not in seen:
+            seen.add(key)
+            ranks.append(index)
+
+    return ranks
+
+def reduce_guesses(matrix, guesses, history):
+    # Only keeps the first guess of each class of equivalent guesses, the guesses being ranks in increasing order
+    group = symmetries(matrix["code_length"], matrix["color_count"], [guess for guess, perfect, partial in history])
+    if group is None:
+        return guesses
+
+    seen = set()
+    reduced = []
+    for guess in guesses:
+        key = symmetry_key(codes.unrank(int(guess), matrix["code_length"], matrix["color_count"]), *group)
+        if key not in seen:
+            seen.add(key)
+            reduced.append(guess)
+
+    return reduced
+
+### END SYMMETRIES ###
+
+### BEGIN STRATEGIES ###
+
+def opening_guess(code_length, color_count):
+    # Half of the pins with the first color and the other half with the second one (1122 for the classic game), which splits the possibilities well
+    return [0] * ((code_length + 1) // 2) + [min(1, color_count - 1)] * (code_length // 2)
+
+def partition_sizes(matrix, guess_index, secrets):
+    # Returns the number of secrets which would give each feedback if they were compared with the guess, which is how well the guess splits the secrets
+    code_length, color_count = matrix["code_length"], matrix["color_count"]
+
+    if matrix["rows"] is not None:
+        return collections.Counter(map(feedback_row(matrix, guess_index).__getitem__, secrets)).values() # Both the lookups and the counting run in C
+    elif matrix["vectorized"] and isinstance(secrets, numpy.ndarray):
+        perfect, partial = compare_batch(codes.unrank(guess_index, code_length, color_count), unrank_batch(secrets, code_length, color_count))
+        return numpy.unique(perfect.astype(numpy.int64) * (code_length + 1) + partial, return_counts=True)[1]
+    else:
+        guess = codes.unrank(guess_index, code_length, color_count)
+        return collections.Counter(utils.compare_codes(guess, codes.unrank(secret, code_length, color_count)) for secret in secrets).values()
+
+# Each scoring strategy turns the sizes of the partitions made by a guess into a score, the guess with the lowest score being played
+SCORES = {
+    "minimax": max, # Knuth's strategy: the number of possibilities left in the worst case
+    "expected_size": lambda sizes: sum(size * size for size in sizes), # Proportional to the expected number of possibilities left
+    "entropy": lambda sizes: sum(size * math.log2(size) for size in sorted(sizes)) # The lower it is, the higher the entropy of the feedback, i.e. the more information the guess gives (sorted so that the same sizes always give exactly the same float)
+}
+
+pool = None # The process pool scoring the guesses, only started the first time it's needed
+
+def score_guesses(code_length, color_count, strategy, guesses, secrets):
+    # Returns the (score, inconsistent, guess) of the best guess; it runs in the pool's processes, which is why it takes arguments which can be sent to them
+    matrix = get_feedback_matrix(code_length, color_count)
+    score_partitions = SCORES[strategy]
+
+    if matrix["rows"] is not None:
+        consistent = set(secrets) # With a feedback matrix, the secrets are all the possibilities, and the guesses which are one of them are better on ties
+
+        select = operator.itemgetter(*secrets) # Picks the feedback of every secret in a row at once (there are always more than two of them here)
+        partitions = lambda guess: collections.Counter(select(feedback_row(matrix, guess))).values()
+    else:
+        consistent = None # Otherwise, the guesses are all taken from the possibilities anyway
+
+        partitions = lambda guess: partition_sizes(matrix, guess, secrets)
+
+    best = None
+    for guess in guesses:
+        score = (score_partitions(partitions(guess)), consistent is not None and guess not in consistent, int(guess)) # Lower is better, ties are broken by the lowest rank
+        if best is None or score < best:
+            best = score
+
+    return best
+
+def scored_guess(matrix, possibilities, strategy, history=()):
+    # The history must be the one which led to the possibilities, as it tells which guesses are equivalent (see representative_guesses)
+    global pool
+
+    if matrix["rows"] is not None:
+        guesses = representative_guesses(matrix["code_length"], matrix["color_count"], tuple(tuple(guess) for guess, perfect, partial in history)) # With a feedback matrix, every code can be scored, even the ones which can't be the secret code anymore
+        guesses = range(matrix["size"]) if guesses is None else guesses
+        secrets = list(possibilities)
+    else:
+        guesses = reduce_guesses(matrix, possibilities.sample(SCORED_GUESSES), history) # Otherwise, scoring every code would take too long so only a sample of the possibilities is scored
+        secrets = possibilities.sample(SCORED_SECRETS)
+
+    arguments = (matrix["code_length"], matrix["color_count"], strategy)
+
+    if PROCESS_COUNT > 1 and len(guesses) * len(secrets) >= PARALLEL_WORK:
+        if pool is None:
+            pool = concurrent.futures.ProcessPoolExecutor(PROCESS_COUNT)
+
+        # Split the guesses in a few chunks per process so that the processes which finish early can take some more work
+        step = -(-len(guesses) // (PROCESS_COUNT * 4))
+        futures = [pool.submit(score_guesses, *arguments, guesses[start:start + step], secrets) for start in range(0, len(guesses), step)]
+        return min(future.result() for future in futures)[2]
+    else:
+        return score_guesses(*arguments, guesses, secrets)[2]
+
+def sampled_guess(possibilities, strategy):
+    # When the codes are too many to be listed, a few consistent codes are searched for and the best one against the others is played
+    if strategy not in SCORES:
+        return possibilities.choice()
+
+    sample = possibilities.sample(SAMPLED_CODES)
+    return min(sample, key=lambda guess: SCORES[strategy](collections.Counter(utils.compare_codes(guess, secret) for secret in sample).values()))
+
+def choose_guess(matrix, possibilities, strategy, history=(), book=True):
+    # Returns the next code to play; the history is the list of (guess, perfect, partial) which led to the possibilities, used to follow the opening book when there is one
+    code_length, color_count = matrix["code_length"], matrix["color_count"]
+
+    if strategy not in STRATEGIES:
+        raise Exception("Unknown strategy selected: {}".format(strategy))
+
+    book_guess = follow_opening_book(matrix, strategy, history) if book else None
+
+    if book_guess is not None:
+        return codes.unrank(book_guess, code_length, color_count)
+
+    strategy = BOOK_STRATEGIES.get(strategy, strategy)
+    if not history and possibilities.count == matrix["size"]: # Nothing is known about the code yet, so the first guess is always the same
+        return opening_guess(code_length, color_count)
+    elif matrix["sampled"]:
+        return sampled_guess(possibilities, strategy)
+    elif strategy in SCORES and possibilities.count > 2: # With one or two possibilities left, playing any of them is already the best move
+        return codes.unrank(scored_guess(matrix, possibilities, strategy, history), code_length, color_count)
+    else:
+        return codes.unrank(possibilities.choice(), code_length, color_count)
+
+def hint(code_length, color_count, strategy, history):
+    # Returns the number of codes which are still possible after the history (a list of (guess, perfect, partial)), only an estimate of at least 1 when the codes are too many to be listed, and the guess the strategy would play next
+    # Used by the server to help its players, it runs in other processes which is why it only takes arguments which can be sent to them
+    matrix = get_feedback_matrix(code_length, color_count)
+    possibilities = state_possibilities(matrix, history)
+
+    if matrix["sampled"]: # The count is only estimated from a few random codes, which finds none long before no code is left, so a consistent guess is always searched for
+        return max(1, possibilities.count), state_guess(matrix, strategy, history)
+
+    if possibilities.count == 0: # The history can't happen with a real code, but there's still something to play
+        return 0, opening_guess(code_length, color_count)
+
+    return possibilities.count, state_guess(matrix, strategy, history)
+
+### END STRATEGIES ###
+
+### BEGIN GAME STATES ###
+
+# A game state is what the solver knows after a history of (guess, perfect, partial): {"possibilities": set, "guesses": {strategy: next guess}}.
+# Consecutive games all go through the same first states, so the states are kept in a cache of each feedback matrix, evicting the least recently used ones when they take more than STATE_BYTES (see state_size). The states of the random strategy are never cached, see deterministic.
+
+def state_size(state):
+    # The bitset of the possibilities and the objects around it (a set shared with the buckets or another state is counted once per state, which overestimates the memory)
+    return STATE_OVERHEAD + len(state["possibilities"].bits)
+
+def deterministic(strategy):
+    # Whether the strategy always plays the same guess after the same history, the states of the others not being worth caching as no other game reaches them
+    return strategy in SCORES or strategy in BOOK_STRATEGIES
+
+def game_state(matrix, history, cache=True):
+    # Returns the state after the history, computed from the state before its last guess (which is most likely cached too) if it isn't in the cache
+    # Without cache, the states computed on the way aren't added to the cache, though the ones already in it are still used
+    key = tuple((tuple(guess), perfect, partial) for guess, perfect, partial in history)
+    states = matrix["states"]
+
+    state = states.get(key)
+    if state is not None:
+        matrix["state_hits"] += 1
+        states.move_to_end(key)
+        return state
+
+    matrix["state_misses"] += 1
+    if history:
+        guess, perfect, partial = history[-1]
+        possibilities = filter_possibilities(matrix, game_state(matrix, history[:-1], cache)["possibilities"], guess, perfect, partial)
+    else:
+        possibilities = new_possibilities(matrix)
+
+    state = {"possibilities": possibilities, "guesses": {}}
+    size = state_size(state)
+
+    if cache and size <= STATE_BYTES:
+        states[key] = state
+        matrix["state_bytes"] += size
+
+        while matrix["state_bytes"] > STATE_BYTES:
+            matrix["state_bytes"] -= state_size(states.popitem(last=False)[1])
+
+    return state
+
+def state_possibilities(matrix, history, cache=True):
+    # Same as filtering new_possibilities by every guess of the history, but the common histories are only filtered once (see game_state for cache)
+    if matrix["sampled"]:
+        possibilities = new_possibilities(matrix) # There's nothing to cache, the possibilities are only the history
+        for guess, perfect, partial in history:
+            possibilities = possibilities.filter(guess, perfect, partial)
+        return possibilities
+
+    return game_state(matrix, list(history), cache)["possibilities"]
+
+def state_guess(matrix, strategy, history):
+    # Same as choose_guess with the possibilities after the history, but the guess of the scoring strategies is only chosen once per state
+    if matrix["sampled"] or not deterministic(strategy): # The guess is picked at random, so the next game must pick another one
+        return choose_guess(matrix, state_possibilities(matrix, history, deterministic(strategy)), strategy, history)
+
+    state = game_state(matrix, list(history))
+    if strategy not in state["guesses"]:
+        state["guesses"][strategy] = choose_guess(matrix, state["possibilities"], strategy, history)
+
+    return state["guesses"][strategy].copy() # The callers may change the guess they get
+
+### END GAME STATES ###
+
+### BEGIN OPENING BOOKS ###
+
+# An opening book is the tree of the first guesses played by a strategy: each node is {"guess": rank, "next": {feedback id: node}}, the feedback ids being strings like in any JSON object.
+
+def opening_book_path(code_length, color_count, strategy):
+    return os.path.join(BOOK_DIRECTORY, "{}x{}_{}.json.gz".format(code_length, color_count, strategy))
+
+@functools.lru_cache(maxsize=16)
+def get_opening_book(code_length, color_count, strategy):
+    # Books are only loaded the first time they are needed, and there may not be any book for this game
+    path = opening_book_path(code_length, color_count, strategy)
+    if not os.path.isfile(path):
+        return None
+
+    with gzip.open(path, "rt") as file:
+        return json.load(file)
+
+def follow_opening_book(matrix, strategy, history):
+    # Returns the next guess of the opening book, or None if the book doesn't go that far or if the game left it (e.g. a resumed game with other guesses)
+    node = get_opening_book(matrix["code_length"], matrix["color_count"], strategy)
+
+    for guess, perfect, partial in history:
+        if node is None or not codes.is_valid_code(guess, matrix["code_length"], matrix["color_count"]) or node["guess"] != codes.rank(guess, matrix["color_count"]):
+            return None
+
+        node = node.get("next", {}).get(str(feedback_id(perfect, partial, matrix["code_length"])))
+
+    return node["guess"] if node is not None else None
+
+def build_opening_book(matrix, possibilities, strategy, depth, history=()):
+    # Plays every possible game of the strategy up to the given number of guesses, and returns the tree of the guesses it played
+    code = choose_guess(matrix, possibilities, strategy, history, book=False) # The book being built mustn't follow an older one
+    guess = codes.rank(code, matrix["color_count"])
+    node = {"guess": guess}
+
+    if depth > 1:
+        node["next"] = {}
+        for feedback, partition in sorted(partition_possibilities(matrix, possibilities, guess).items()):
+            if feedback != feedback_id(matrix["code_length"], 0, matrix["code_length"]): # There's nothing left to guess when the code was found
+                node["next"][str(feedback)] = build_opening_book(matrix, partition, strategy, depth - 1, list(history) + [(code, *feedback_from_id(feedback, matrix["code_length"]))])
+
+    return node
+
+def save_opening_book(book, code_length, color_count, strategy):
+    os.makedirs(BOOK_DIRECTORY, exist_ok=True)
+
+    with gzip.open(opening_book_path(code_length, color_count, strategy), "wt") as file:
+        json.dump(book, file, separators=(",", ":")) # No spaces, to keep the file compact
+
+    get_opening_book.cache_clear()
+
+### END OPENING BOOKS ###
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+### BEGIN IMPORTS ###
+
+import os
+import re
+import json
+import time
+import pickle
+import threading
+import multiprocessing
+
+### END IMPORTS ###
+
+### BEGIN CONSTANTS ###
+
+SNAPSHOT_PATH = "server.snapshot" # The players, their usernames and the scoreboard as of the end of a journal segment, pickled
+SEGMENT_PATH = "server.{}.journal" # The changes since, one JSON record per line, in numbered segments
+
+SYNC_INTERVAL = 0.2 # The seconds between two writes of the journal to the disk, a crash loses at most the changes of that time
+COMPACT_INTERVAL = 600 # The seconds between two compactions of the journal into the snapshot
+COMPACT_SIZE = 64 * 1024 * 1024 # The size of a segment after which it's compacted right away
+
+### END CONSTANTS ###
+
+### BEGIN STORAGE ###
+
+def segments():
+    # The numbers of the segments on the disk, in the order they were written
+    numbers = []
+    for name in os.listdir("."):
+        match = re.match(r"^" + re.escape(SEGMENT_PATH).replace(r"\{\}", r"(\d+)") + r"$", name)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+def replay(path, user_list, usernames, entries):
+    # Applies the records of a segment, up to the first one which was cut by a crash
+    with open(path, "r", encoding="utf8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+
+            if record[0] == "user":
+                if record[1] in user_list and usernames.get(user_list[record[1]]["username"]) == record[1]:
+                    del usernames[user_list[record[1]]["username"]]
+
+                if record[2] is None:
+                    user_list.pop(record[1], None)
+                else:
+                    user_list[record[1]] = record[2]
+                    usernames[record[2]["username"]] = record[1]
+            elif record[0] == "attempt":
+                if "game" in user_list.get(record[1], {}):
+                    user_list[record[1]]["game"]["attempts"].append(record[2])
+            elif record[0] == "score":
+                entries.append(tuple(record[1]))
+
+def load_snapshot():
+    if not os.path.isfile(SNAPSHOT_PATH):
+        return {"segment": -1, "user_list": {}, "usernames": {}, "entries": []}
+
+    with open(SNAPSHOT_PATH, "rb") as file:
+        snapshot = pickle.load(file)
+
+    if "usernames" not in snapshot: # Written before the usernames were indexed
+        snapshot["usernames"] = {user["username"]: address for address, user in snapshot["user_list"].items()}
+
+    return snapshot
+
+def load():
+    # Returns the players, their usernames, the scoreboard entries and the number of the next segment, or None if nothing was ever saved
+    if not os.path.isfile(SNAPSHOT_PATH) and not segments():
+        return None
+
+    snapshot = load_snapshot()
+    user_list, usernames, entries, segment = snapshot["user_list"], snapshot["usernames"], snapshot["entries"], snapshot["segment"]
+    for number in segments():
+        if number > snapshot["segment"]:
+            replay(SEGMENT_PATH.format(number), user_list, usernames, entries)
+            segment = number
+
+    return user_list, usernames, entries, segment + 1
+
+def save_snapshot(user_list, usernames, entries, segment):
+    # Replaces the snapshot at once, so that a crash leaves either the old one or the new one
+    with open(SNAPSHOT_PATH + ".tmp", "wb") as file:
+        pickle.dump({"segment": segment, "user_list": user_list, "usernames": usernames, "entries": entries}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(SNAPSHOT_PATH + ".tmp", SNAPSHOT_PATH)
+
+def compact(last_segment):
+    # Merges the segments up to last_segment into the snapshot, and deletes them
+    snapshot = load_snapshot()
+
+    user_list, usernames, entries = snapshot["user_list"], snapshot["usernames"], snapshot["entries"]
+    merged = [number for number in segments() if snapshot["segment"] < number <= last_segment]
+    for number in merged:
+        replay(SEGMENT_PATH.format(number), user_list, usernames, entries)
+
+    save_snapshot(user_list, usernames, entries, max(merged + [snapshot["segment"]]))
+
+    for number in segments():
+        if number <= last_segment:
+            os.remove(SEGMENT_PATH.format(number))
+
+class Journal:
+    # Appends every change to the players and the scoreboard to the current segment
+    # The records are written and synced to the disk by a background thread every SYNC_INTERVAL, which also compacts the closed segments in another process every COMPACT_INTERVAL
+
+    def __init__(self, segment):
+        self.segment = segment
+        self.file = open(SEGMENT_PATH.format(segment), "a", encoding="utf8")
+        self.pending = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record_user(self, address, user):
+        # The whole player is written (None once it's deleted), so that replaying a segment only keeps the last state of each player
+        line = json.dumps(["user", address, user]) + "\n"
+        with self.lock:
+            self.pending.append(line)
+
+    def record_attempt(self, address, guess):
+        # An attempt which doesn't end the game, appended to the game of the player when replayed
+        line = json.dumps(["attempt", address, guess]) + "\n"
+        with self.lock:
+            self.pending.append(line)
+
+    def record_score(self, entry):
+        line = json.dumps(["score", list(entry)]) + "\n"
+        with self.lock:
+            self.pending.append(line)
+
+    def sync(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+
+        if pending:
+            self.file.write("".join(pending))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def rotate(self):
+        # Closes the current segment and starts the next one, returning the number of the closed one
+        self.file.close()
+        self.segment += 1
+        self.file = open(SEGMENT_PATH.format(self.segment), "a", encoding="utf8")
+        return self.segment - 1
+
+    def run(self):
+        last_compaction = time.time()
+        process = None # The compaction running, which is only waited for once it's done so that the records keep being synced meanwhile
+        while not self.stopped.wait(SYNC_INTERVAL):
+            self.sync()
+
+            if process is not None and not process.is_alive():
+                process.join()
+                process = None
+                last_compaction = time.time()
+
+            if process is None and (time.time() - last_compaction >= COMPACT_INTERVAL or self.file.tell() >= COMPACT_SIZE):
+                # Unpickling the snapshot takes a while and would hold the GIL of the server, and a spawned process doesn't inherit its locks
+                process = multiprocessing.get_context("spawn").Process(target=compact, args=[self.rotate()])
+                process.start()
+
+        if process is not None:
+            process.join()
+
+    def close(self):
+        # Writes the last records, and compacts everything so that the next start only has the snapshot to load
+        self.stopped.set()
+        self.thread.join()
+
+        self.sync()
+        self.file.close()
+        compact(self.segment)
+
+### END STORAGE ###
@@ -7,6 +7,7 @@ import base64
 import curses
 import socket
 import random
+import operator
 
 ### END IMPORTS ###
 
@@ -17,6 +18,7 @@ PREFIX = "Guess:"
 DEFAULT_CODE_LENGTH = 4
 DEFAULT_COLOR_COUNT = 6
 DEFAULT_MAX_ATTEMPTS = 12
+DEFAULT_STRATEGY = "minimax" # The strategy used by the computer to pick its guesses, see solver.STRATEGIES
 
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 45735
@@ -52,22 +54,20 @@ def find_nearest_color(r, g, b):
     return best_color if best_color is not None else 0 # If a color was found, we return it, or we return 0 which is the basic black and white color
 
 def compare_codes(guess, correct):
-    guess, correct = guess.copy(), correct.copy() # Clone the lists because we are going to edit them, so we don't want to mess up the main program's lists
-
-    perfect = 0
-    for i in range(min(len(guess), len(correct))):
-        if guess[i - perfect] == correct[i - perfect]: # If the guessed color is the right one
-            del guess[i - perfect] # We remove that color from both lists
-            del correct[i - perfect]
-            perfect += 1 # And we increment the perfect color counter
-
-    partial = 0
-    for left in guess: # For each color left in the guess
-        if left in correct: # If the color is also in the correct answer (it can't be at the right position, or we would have found it in the first loop)
-            correct.remove(left) # We remove it from the correct list (no need to remove it in the guessed list as we're not using it further)
-            partial += 1 # And we increment the partial color counter
-
-    return perfect, partial
+    # Runs in O(code_length + color_count), as long codes are compared on every guess (lists can't be edited in place without O(code_length ** 2) shifts)
+    left = {} # The number of pins of each color in the correct code which weren't matched yet
+    for color in correct:
+        left[color] = left.get(color, 0) + 1
+
+    common = 0 # The number of pins which are in both codes, wherever they are (each pin of the correct code can only be matched once)
+    for color in guess:
+        count = left.get(color)
+        if count:
+            left[color] = count - 1
+            common += 1
+
+    perfect = sum(map(operator.eq, guess, correct)) # The pins with the right color at the right position (compared in C, and only up to the shortest code)
+    return perfect, common - perfect # The perfect pins are also common pins, the others are the partial ones
 
 def encode_token(gamemode, score, games, color_count, max_attempts, code, attempts):
     token, bits = 0, 0